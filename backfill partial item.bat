@@ -0,0 +1,7 @@
+@echo off
+
+REM Mengatur environment variable
+call venv\Scripts\activate
+
+REM menjalankan file main.py
+py main.py backfill
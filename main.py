@@ -1,8 +1,9 @@
-import asyncio, json, os, traceback, random, time, sys, csv, requests, math
-from typing import List, Any, Literal, Dict
+import asyncio, json, os, traceback, random, time, sys, csv, requests, math, itertools, codecs, gzip, re, socket, io, mmap
+from typing import List, Any, Literal, Iterable, Iterator, Callable, Awaitable
 from urllib.parse import urlparse, urlencode, parse_qs, ParseResult, urlunparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 
 # ================================ UPDATE SCRIPT ================================
@@ -45,13 +46,14 @@ class UpdateScript:
         print('script updated...')
 
 try:
-    from playwright.async_api import async_playwright, Browser, BrowserContext
+    from playwright.async_api import async_playwright, Browser, BrowserContext, Route
     from playwright.async_api._generated import Request, Page
     from rich import print
     from pydantic import BaseModel
-    from pymongo import MongoClient
-    from pymongo.cursor import Cursor
-    from pymongo.errors import DuplicateKeyError
+    from pymongo import MongoClient, UpdateOne, ReplaceOne, ReturnDocument
+    from bson import ObjectId
+    from pymongo.collection import Collection
+    from pymongo.errors import BulkWriteError
     from tqdm import tqdm
     # from bs4 import BeautifulSoup
     
@@ -63,6 +65,11 @@ except:
     traceback.print_exc()
     time.sleep(10)
     
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    
 
 # ================================ MONGODB ================================
 
@@ -90,6 +97,8 @@ def delete_under_score_from_key(data: dict[str, Any] | list[dict[str, Any]]) ->
 
 def convert_product_shopee_to_pdc(product: dict, namespace: str='hoki', from_data: bool=True, rnd: float=0.25390100699475204, Rnd: float=0.38799338406558054):
     data: dict[str, dict[str, dict]] = product['data'] if from_data else product
+    shop_vouchers = delete_under_score_from_key(data['shop_vouchers'])
+    catids = [catid['catid'] for catid in data['item']['categories']]
     public_source = {
         "productitem": delete_under_score_from_key(data['item']),
         "productprice": delete_under_score_from_key(data['product_price']),
@@ -99,20 +108,20 @@ def convert_product_shopee_to_pdc(product: dict, namespace: str='hoki', from_dat
         "productattributes": delete_under_score_from_key(data['product_attributes']),
         "productshipping": delete_under_score_from_key(data['product_shipping']),
         "shippingmeta": delete_under_score_from_key(data['shipping_meta']),
-        "shopvouchers": delete_under_score_from_key(data['shop_vouchers']),
+        "shopvouchers": shop_vouchers,
         "freereturn": delete_under_score_from_key(data['free_return']),
         'productinfo': {
             'agegate': delete_under_score_from_key(data['age_gate']),
             'coininfo': delete_under_score_from_key(data['coin_info']),
             'flashsale': delete_under_score_from_key(data['flash_sale']),
-            'shopvouchers': delete_under_score_from_key(data['shop_vouchers'])},
+            'shopvouchers': shop_vouchers},
         'itemid': data['item']['item_id'],
         "name": data['item']['title'],
         "sold": 0,
         "imageurl": data['item']['image'],
         "imageurls": data['product_images']['images'],
         "userid": data['shop_detailed']['userid'],
-        "catid": [catid['catid'] for catid in data['item']['categories']][0],
+        "catid": catids[0],
         'bundledealid': 0,
         'canusebundledeal': False,
         'clipinfo': None,
@@ -159,9 +168,9 @@ def convert_product_shopee_to_pdc(product: dict, namespace: str='hoki', from_dat
             "location": data['item']['shop_location']
         },
         "shop_location": data['item']['shop_location'],
-        "catid": [catid['catid'] for catid in data['item']['categories']][0],
-        "category": [catid['catid'] for catid in data['item']['categories']],
-        "category_id": [catid['catid'] for catid in data['item']['categories']][-1],
+        "catid": catids[0],
+        "category": catids,
+        "category_id": catids[-1],
         "cat_name": [catid['display_name'] for catid in data['item']['categories']][-1],
         "categories": data['item']['categories'],
         "brand_id": data['item']['brand_id'],
@@ -174,45 +183,477 @@ def convert_product_shopee_to_pdc(product: dict, namespace: str='hoki', from_dat
         "Rnd": Rnd
     }
 
-def insert_one_item_to_db(cursor_item: Cursor, data: dict):
+def convert_item_basic_to_pdc(item_basic: dict, namespace: str='hoki', rnd: float=0.25390100699475204, Rnd: float=0.38799338406558054):
+    catid = item_basic.get('catid')
+    return {
+        'processed': False,
+        'marketplace': 'shopee',
+        'id': item_basic['itemid'],
+        'productid': item_basic['itemid'],
+        "name": item_basic['name'],
+        'namespace': namespace,
+        "rnd": rnd,
+        "image": item_basic.get('image'),
+        "images": item_basic.get('images', []),
+        "sold": item_basic.get('historical_sold', item_basic.get('sold', 0)),
+        "price": int(item_basic.get('price', item_basic.get('price_min', 0)) / 100000),
+        "price_before_discount": int((item_basic.get('price_before_discount') or item_basic.get('price', 0)) / 100000),
+        "price_after_discount": int(item_basic.get('price', item_basic.get('price_min', 0)) / 100000),
+        "shop": {
+            "shopid": item_basic['shopid'],
+            "location": item_basic.get('shop_location')
+        },
+        "shop_location": item_basic.get('shop_location'),
+        "catid": catid,
+        "category": [catid],
+        "category_id": catid,
+        "cat_name": None,
+        "categories": [],
+        "brand_id": None,
+        "stock": item_basic.get('stock', 0),
+        "desc": '',
+        "url": f"https://shopee.co.id/product/{item_basic['shopid']}/{item_basic['itemid']}/",
+        "public_categ": catid,
+        'public_source': {'itembasic': delete_under_score_from_key(item_basic)},
+        "type": "search",
+        "partial": True,
+        "Rnd": Rnd
+    }
+
+COMPACT_PDC_FIELDS: dict[str, Callable[[dict], Any]] = {
+    'imageurls': lambda data: data.get('images'),
+    'productimages.images': lambda data: data.get('images'),
+    'productinfo.shopvouchers': lambda data: data['public_source'].get('shopvouchers'),
+    'productitem.categories': lambda data: delete_under_score_from_key(data.get('categories', [])),
+    'productitem.description': lambda data: data.get('desc'),
+}
+
+COMPACT_PDC_VIEW_FIELDS: dict[str, Any] = {
+    'imageurls': '$images',
+    'productimages.images': '$images',
+    'productinfo.shopvouchers': '$public_source.shopvouchers',
+    'productitem.categories': {'$map': {'input': '$categories', 'as': 'category', 'in': {'$arrayToObject': {'$map': {
+        'input': {'$objectToArray': '$$category'},
+        'as': 'field',
+        'in': {'k': {'$replaceAll': {'input': '$$field.k', 'find': '_', 'replacement': ''}}, 'v': '$$field.v'}
+    }}}}},
+    'productitem.description': '$desc',
+}
+
+def get_compact_parent(data: dict, field: str) -> tuple[dict | None, str]:
+    *parents, key = field.split('.')
+    parent = data.get('public_source')
+    for name in parents:
+        parent = parent.get(name) if isinstance(parent, dict) else None
+        
+    return parent if isinstance(parent, dict) else None, key
+
+def compact_pdc(data: dict) -> dict:
+    if not isinstance(data.get('public_source'), dict) or 'compact' in data:
+        return data
+    
+    compacted = []
+    for field, get_source in COMPACT_PDC_FIELDS.items():
+        parent, key = get_compact_parent(data, field)
+        if parent is not None and key in parent and parent[key] == get_source(data):
+            del parent[key]
+            compacted.append(field)
+            
+    data['compact'] = compacted
+    return data
+
+def expand_pdc(data: dict) -> dict:
+    compacted = data.pop('compact', None)
+    if not compacted:
+        return data
+    
+    for field in compacted:
+        parent, key = get_compact_parent(data, field)
+        if parent is not None:
+            parent[key] = COMPACT_PDC_FIELDS[field](data)
+            
+    return data
+
+def store_pdc(data: dict) -> dict:
+    return compact_pdc(data) if get_db_config().compact_storage else data
+
+def ensure_legacy_view(collection: Collection):
+    fields = {
+        f'public_source.{field}': {'$cond': [{'$in': [field, {'$ifNull': ['$compact', []]}]}, expression, f'$public_source.{field}']}
+        for field, expression in COMPACT_PDC_VIEW_FIELDS.items()
+    }
+    pipeline = [{'$addFields': fields}, {'$unset': 'compact'}]
+    view_name = f'{collection.name}_legacy'
+    try:
+        if view_name in collection.database.list_collection_names(filter={'name': view_name}):
+            collection.database.command('collMod', view_name, viewOn=collection.name, pipeline=pipeline)
+        else:
+            collection.database.command('create', view_name, viewOn=collection.name, pipeline=pipeline)
+    except Exception as e:
+        print(f'error create view {view_name}: {e}')
+
+def insert_many_item_to_db(collection: Collection, data: list[dict]) -> tuple[list[dict], dict[str, int]]:
+    status = {'inserted': 0, 'duplicate': 0, 'error': 0}
+    if not data:
+        return [], status
+    
+    data = [store_pdc(item) for item in data]
+    failed_index = set()
     try:
-        cursor_item.collection.insert_one(data)
-        return True
-    except DuplicateKeyError as de:
-        print(f'duplikat: {de}')
-        return False
+        collection.insert_many(data, ordered=False)
+    except BulkWriteError as bwe:
+        for write_error in bwe.details.get('writeErrors', []):
+            failed_index.add(write_error['index'])
+            if write_error['code'] == 11000:
+                status['duplicate'] += 1
+            else:
+                status['error'] += 1
+                
     except Exception as e:
         print(f'error: {e}')
-        return False
+        status['error'] = len(data)
+        return [], status
+    
+    inserted = [item for index, item in enumerate(data) if index not in failed_index]
+    status['inserted'] = len(inserted)
+    update_namespace_summary(collection, inserted)
+    return inserted, status
+
+def upsert_items_to_db(collection: Collection, data: list[dict]) -> dict[str, int]:
+    status = {'upserted': 0, 'modified': 0, 'error': 0}
+    if not data:
+        return status
     
-def insert_many_item_to_db(cursor_item: Cursor, data: list[dict]):
+    requests_item = [ReplaceOne({'namespace': item['namespace'], 'id': item['id']}, store_pdc(item), upsert=True) for item in data]
     try:
-        result = cursor_item.collection.insert_many(data)
-        return True
-    except DuplicateKeyError as de:
-        print(f'duplikat: {de}')
-        return False
+        result = collection.bulk_write(requests_item, ordered=False)
+        status['upserted'] = result.upserted_count
+        status['modified'] = result.modified_count
+    except BulkWriteError as bwe:
+        status['upserted'] = bwe.details.get('nUpserted', 0)
+        status['modified'] = bwe.details.get('nModified', 0)
+        status['error'] = len(bwe.details.get('writeErrors', []))
     except Exception as e:
         print(f'error: {e}')
-        return False
+        status['error'] = len(data)
+        
+    return status
+
+def insert_batches_to_db(collection: Collection, data: Iterable[dict], batch_size: int | None = None) -> dict[str, int]:
+    status = Counter({'inserted': 0, 'duplicate': 0, 'error': 0})
+    for batch in iter_chunks(data, batch_size or get_db_config().batch_size):
+        _, batch_status = insert_many_item_to_db(collection, batch)
+        status.update(batch_status)
+        
+    return dict(status)
+
+class MongoBatchWriter:
+    def __init__(self, collection: Collection, batch_size: int = 50, flush_interval: float = 2.0, max_queue: int = 500, on_inserted: Callable[[list[dict], dict[str, int]], Any] | None = None) -> None:
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_inserted = on_inserted
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=max_queue)
+        self.task: asyncio.Task | None = None
+        
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        
+    async def put(self, item: dict):
+        # a full queue means the database is behind, so the caller waits (backpressure)
+        await self.queue.put(item)
+        
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        is_closed = False
+        while not is_closed:
+            item = await self.queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                
+                if item is None:
+                    is_closed = True
+                    break
+                
+                batch.append(item)
+                
+            await self.flush(batch)
+            
+    async def flush(self, batch: list[dict]):
+        inserted, status = await asyncio.to_thread(insert_many_item_to_db, self.collection, batch)
+        if self.on_inserted:
+            try:
+                self.on_inserted(inserted, status)
+            except Exception as e:
+                print(f'error on_inserted: {e}')
+                
+    async def close(self):
+        if self.task is None:
+            return
+        
+        if not self.task.done():
+            await self.queue.put(None)
+            
+        await self.task
+        self.task = None
+
+class ScrapedItemIndex:
+    def __init__(self, collection: Collection, name_space: str | None = None) -> None:
+        self.collection = collection
+        self.name_space = name_space
+        self.item_ids: set[int] = set()
+        self.last_object_id: ObjectId | None = None
+        self.last_refresh = 0.0
+        
+    def set_name_space(self, name_space: str | None):
+        if name_space != self.name_space:
+            self.name_space = name_space
+            self.item_ids = set()
+            self.last_object_id = None
+            self.last_refresh = 0.0
+        
+    def refresh(self):
+        query: dict[str, Any] = {}
+        if self.name_space is not None:
+            query['namespace'] = self.name_space
+            
+        if self.last_object_id is not None:
+            # ObjectIds from other clients are only roughly ordered, re-read the last minute
+            query['_id'] = {'$gt': ObjectId.from_datetime(self.last_object_id.generation_time - timedelta(minutes=1))}
+            
+        for data in self.collection.find(query, {'id': 1}, batch_size=get_db_config().batch_size).sort('_id', 1):
+            if 'id' in data:
+                self.item_ids.add(data['id'])
+            self.last_object_id = data['_id']
+            
+        self.last_refresh = time.time()
+        
+    def is_stale(self, interval: float) -> bool:
+        return (time.time() - self.last_refresh) > interval
+        
+    def add(self, item_id: int):
+        self.item_ids.add(item_id)
+        
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.item_ids
+    
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+# stored next to the summaries, a dict _id can never collide with a namespace string
+SUMMARY_BUILT_ID = {'built': True}
+
+def get_summary_collection(collection: Collection) -> Collection:
+    return collection.database[f'{collection.name}_namespace_summary']
 
-def get_client():
-    return MongoClient('localhost', 27017)
+def get_namespace_shop_collection(collection: Collection) -> Collection:
+    return collection.database[f'{collection.name}_namespace_shop']
 
-def get_cursor(path: list[str]=['kampretcode2', 'item']):
-    client = get_client()
-    data_path = {} 
-    for database_names in client.list_database_names():
-        db = client[database_names]
-        data_path[database_names] = {k: db[k].find() for k in db.list_collection_names()}
+def update_namespace_summary(collection: Collection, items: list[dict], count_items: bool = True):
+    stats: dict[str, dict[str, Any]] = {}
+    shop_ops: list[UpdateOne] = []
+    shop_ops_namespace: list[str] = []
+    for item in items:
+        name_space = item.get('namespace')
+        if name_space is None:
+            continue
+        
+        stat = stats.setdefault(name_space, {'count': 0, 'shop_count': 0, 'prices': []})
+        if count_items:
+            stat['count'] += 1
+        if isinstance(item.get('price'), (int, float)):
+            stat['prices'].append(item['price'])
+            
+        shopid = (item.get('shop') or {}).get('shopid')
+        if shopid is not None:
+            shop_ops.append(UpdateOne({'namespace': name_space, 'shopid': shopid}, {'$setOnInsert': {'namespace': name_space, 'shopid': shopid}}, upsert=True))
+            shop_ops_namespace.append(name_space)
+            
+    if not stats:
+        return
+    
+    try:
+        if shop_ops:
+            try:
+                upserted_index = list(get_namespace_shop_collection(collection).bulk_write(shop_ops, ordered=False).upserted_ids)
+            except BulkWriteError as bwe:
+                upserted_index = [upsert['index'] for upsert in bwe.details.get('upserted', [])]
+                
+            for index in upserted_index:
+                stats[shop_ops_namespace[index]]['shop_count'] += 1
+                
+        summary_ops = []
+        for name_space, stat in stats.items():
+            update: dict[str, Any] = {
+                '$inc': {'count': stat['count'], 'shop_count': stat['shop_count']},
+                '$max': {'last_inserted': datetime.now()},
+            }
+            if stat['prices']:
+                update['$min'] = {'price_min': min(stat['prices'])}
+                update['$max']['price_max'] = max(stat['prices'])
+                
+            summary_ops.append(UpdateOne({'_id': name_space}, update, upsert=True))
+            
+        get_summary_collection(collection).bulk_write(summary_ops, ordered=False)
+        
+    except Exception as e:
+        print(f'error update namespace summary: {e}')
+
+def delete_namespace_summary(collection: Collection, name_space: str):
+    get_summary_collection(collection).delete_one({'_id': name_space})
+    get_namespace_shop_collection(collection).delete_many({'namespace': name_space})
+
+def rebuild_namespace_summary(collection: Collection):
+    shop_collection = get_namespace_shop_collection(collection)
+    collection.aggregate([
+        {'$match': {'namespace': {'$exists': True}, 'shop.shopid': {'$exists': True}}},
+        {'$group': {'_id': {'namespace': '$namespace', 'shopid': '$shop.shopid'}}},
+        {'$project': {'_id': 0, 'namespace': '$_id.namespace', 'shopid': '$_id.shopid'}},
+        {'$out': shop_collection.name}
+    ], allowDiskUse=True)
+    shop_collection.create_index([('namespace', 1), ('shopid', 1)], unique=True)
+    shop_count = {data['_id']: data['count'] for data in shop_collection.aggregate([{'$group': {'_id': '$namespace', 'count': {'$sum': 1}}}])}
+    
+    summary = collection.aggregate([
+        {'$match': {'namespace': {'$exists': True}}},
+        {'$group': {
+            '_id': '$namespace',
+            'count': {'$sum': 1},
+            'price_min': {'$min': '$price'},
+            'price_max': {'$max': '$price'},
+            'last_id': {'$max': '$_id'},
+        }}
+    ], allowDiskUse=True)
+    
+    summary_data = [{
+        '_id': data['_id'],
+        'count': data['count'],
+        'shop_count': shop_count.get(data['_id'], 0),
+        'price_min': data['price_min'],
+        'price_max': data['price_max'],
+        'last_inserted': data['last_id'].generation_time.astimezone().replace(tzinfo=None) if isinstance(data['last_id'], ObjectId) else None,
+    } for data in summary]
+    
+    summary_collection = get_summary_collection(collection)
+    summary_collection.delete_many({})
+    if summary_data:
+        summary_collection.insert_many(summary_data)
         
-    cursor_item: Cursor = data_path[path[0]][path[1]]
-    return cursor_item
+    summary_collection.insert_one({'_id': SUMMARY_BUILT_ID, 'built': datetime.now()})
+
+def get_namespace_summary(collection: Collection) -> dict[str, dict[str, Any]]:
+    summary_collection = get_summary_collection(collection)
+    # incremental updates may have created partial summaries before the first full build
+    if summary_collection.find_one({'_id': SUMMARY_BUILT_ID}) is None:
+        print('build namespace summary...')
+        rebuild_namespace_summary(collection)
+        
+    return {data.pop('_id'): data for data in summary_collection.find({'_id': {'$ne': SUMMARY_BUILT_ID}})}
+
+def ensure_indexes(collection: Collection):
+    collection.create_index([('namespace', 1), ('marketplace', 1)], name='namespace_marketplace')
+    collection.create_index([('namespace', 1), ('id', 1)], name='namespace_id')
+    get_namespace_shop_collection(collection).create_index([('namespace', 1), ('shopid', 1)], unique=True)
+    if get_db_config().compact_storage:
+        ensure_legacy_view(collection)
+
+def get_job_collection(collection: Collection) -> Collection:
+    return collection.database[f'{collection.name}_scrape_job']
+
+def ensure_job_indexes(job_collection: Collection):
+    job_collection.create_index([('status', 1), ('lease_until', 1)], name='status_lease')
+
+def sync_scrape_jobs(job_collection: Collection, urls: list[str]) -> tuple[int, list[str]]:
+    now = time.time()
+    unique_urls = list(dict.fromkeys(urls))
+    requests_job = [
+        UpdateOne(
+            {'_id': url, 'status': {'$in': ['done', 'failed']}},
+            {'$set': {'url': url, 'last_url': url, 'status': 'pending', 'retry': 0, 'worker': None, 'lease_until': None, 'error': None, 'checkpoint_item_ids': [], 'updated': now}, '$setOnInsert': {'created': now}},
+            upsert=True
+        )
+        for url in unique_urls
+    ]
+    if not requests_job:
+        return 0, []
+    
+    skipped = 0
+    failed_urls: list[str] = []
+    try:
+        job_collection.bulk_write(requests_job, ordered=False)
+    except BulkWriteError as bwe:
+        for write_error in bwe.details.get('writeErrors', []):
+            if write_error['code'] == 11000:
+                skipped += 1
+            else:
+                print(f'error sync job: {write_error.get("errmsg")}')
+                failed_urls.append(unique_urls[write_error['index']])
+                
+    return len(requests_job) - skipped - len(failed_urls), failed_urls
+
+def claim_scrape_job(job_collection: Collection, worker_id: str, lease_seconds: int) -> dict[str, Any] | None:
+    now = time.time()
+    return job_collection.find_one_and_update(
+        {'$or': [{'status': 'pending'}, {'status': 'running', 'lease_until': {'$lt': now}}]},
+        {'$set': {'status': 'running', 'worker': worker_id, 'lease_until': now + lease_seconds, 'updated': now}},
+        sort=[('retry', 1), ('created', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def heartbeat_scrape_job(job_collection: Collection, job: dict[str, Any], worker_id: str, lease_seconds: int) -> bool:
+    now = time.time()
+    result = job_collection.update_one(
+        {'_id': job['_id'], 'status': 'running', 'worker': worker_id},
+        {'$set': {'lease_until': now + lease_seconds, 'last_url': job['last_url'], 'checkpoint_item_ids': job.get('checkpoint_item_ids', []), 'updated': now}}
+    )
+    return result.matched_count == 1
+
+def finish_scrape_job(job_collection: Collection, job: dict[str, Any], worker_id: str, status: Literal['pending', 'done', 'failed'], error: str | None = None) -> bool:
+    result = job_collection.update_one(
+        {'_id': job['_id'], 'status': 'running', 'worker': worker_id},
+        {'$set': {'status': status, 'last_url': job['last_url'], 'retry': job['retry'], 'error': error, 'checkpoint_item_ids': job.get('checkpoint_item_ids', []), 'worker': None, 'lease_until': None, 'updated': time.time()}}
+    )
+    return result.matched_count == 1
+
+def get_next_lease_expiry(job_collection: Collection) -> float | None:
+    job = job_collection.find_one({'status': 'running'}, sort=[('lease_until', 1)])
+    if job is None:
+        return None
+    
+    return max(job['lease_until'] - time.time(), 0)
+
+mongo_client: MongoClient | None = None
+
+def get_client() -> MongoClient:
+    global mongo_client
+    if mongo_client is None:
+        db_config = get_db_config()
+        mongo_client = MongoClient(db_config.host, db_config.port, maxPoolSize=db_config.max_pool_size)
+        
+    return mongo_client
+
+def close_client():
+    global mongo_client
+    if mongo_client is not None:
+        mongo_client.close()
+        mongo_client = None
+
+def get_collection(name: str | None = None) -> Collection:
+    db_config = get_db_config()
+    return get_client()[db_config.database][name or db_config.collection]
 
 def convert_to_pdc_from_json():
     try:
         name_space = str(input('masukkan namespace (default: "hoki"): '))
-        if not file_json_path:
+        if not name_space:
             raise ValueError('invalid input!')
     except:
         name_space = 'hoki'
@@ -225,237 +666,669 @@ def convert_to_pdc_from_json():
         file_json_path = 'result.json'
     
     if os.path.exists(file_json_path):
-        with open(file_json_path, 'r') as f:
-            data = json.load(f)
-            
-        if not isinstance(data, list):
-            raise TypeError('type is not list[dict]')
-        else:
-            cursor = get_cursor()
-            data_product_converted = [convert_product_shopee_to_pdc(product, name_space, from_data=False) for product in data]
-            for data_produck in data_product_converted:
-                insert_one_item_to_db(cursor, data_produck)
-            os.remove(file_json_path)
+        collection = get_collection()
+        data_product_converted = (convert_product_shopee_to_pdc(product, name_space, from_data=False) for product in iter_json_file(file_json_path))
+        status = insert_batches_to_db(collection, data_product_converted)
+        print(f'inserted: {status["inserted"]} | duplikat: {status["duplicate"]} | error: {status["error"]}')
+        os.remove(file_json_path)
             
 
 # ================================ CONVERT COLLECTION TO QLOBOT ================================
 
+QLOBOT_PROJECTION_SOURCE = [
+    'productitem.condition',
+    'productitem.categories',
+    'productitem.models',
+    'productitem.tiervariations',
+    'productitem.tier_variations',
+    'productreview.ratingstar',
+    'productreview.ratingcount',
+]
+QLOBOT_PROJECTION = {
+    '_id': 0, 'url': 1, 'name': 1, 'price': 1, 'image': 1, 'images': 1, 'desc': 1, 'sold': 1, 'stock': 1, 'categories': 1, 'compact': 1,
+    **{f'public_source.{field}': 1 for field in QLOBOT_PROJECTION_SOURCE},
+    **{f'publicsource.{field}': 1 for field in QLOBOT_PROJECTION_SOURCE},
+}
+
 def fix_url(url: str) -> str:
     if url and 'https://cf.shopee.co.id' not in url:
         url = f'https://cf.shopee.co.id/file/{url}'
         
     return url
 
-def filter_duplicates_list_dict(list_dicts: list[dict], key='url') -> list[dict]:
+def iter_unique_dict(list_dicts: Iterable[dict], key='url') -> Iterator[dict]:
     seen_urls = set()
-    filtered_list = [d for d in list_dicts if not (d[key] in seen_urls or seen_urls.add(d[key]))]
-    return filtered_list
+    for d in list_dicts:
+        if d[key] in seen_urls:
+            continue
+        
+        seen_urls.add(d[key])
+        yield d
 
-def filter_collection_from_pdc(data_list: list[dict]) -> tuple[list,list]:
-    data_produk = []
-    data_produk_variant = []
-    for data in tqdm(data_list, desc='Filter Product', ncols=100):
-        try:
-            to_items = data
-            images = data
-            public_source = to_items['public_source'] if 'public_source' in to_items else to_items['publicsource']
-            productitem = public_source['productitem']
-            url = data['url']
-            name: str = to_items['name']
-            price = to_items['price']
-            thumbnail_1 = to_items['image']
-            thumbnail_2 = fix_url(images['images'][1]) if len(images['images']) >= 2 else ""
-            thumbnail_3 = fix_url(images['images'][2]) if len(images['images']) >= 3 else ""
-            thumbnail_4 = fix_url(images['images'][3]) if len(images['images']) >= 4 else ""
-            thumbnail_5 = fix_url(images['images'][4]) if len(images['images']) >= 5 else ""
-            thumbnail_6 = fix_url(images['images'][5]) if len(images['images']) >= 6 else ""
-            thumbnail_7 = fix_url(images['images'][6]) if len(images['images']) >= 7 else ""
-            thumbnail_8 = fix_url(images['images'][7]) if len(images['images']) >= 8 else ""
-            thumbnail_9 = fix_url(images['images'][8]) if len(images['images']) >= 9 else ""
-            thumbnail_10 = fix_url(images['images'][9]) if len(images['images']) >= 10 else ""
-            video = ''
-            description: str = to_items['desc']
-            description_html = ''
-            weight = 0
-            if 'condition' in productitem:
-                condition = 'Baru' if productitem['condition'] == 1 else 'Bekas'
-            else:
-                condition = 'Baru'
-            min_order = 1
-            category_1 = productitem['categories'][0]['displayname'] if len(productitem['categories']) >= 1 else ""
-            category_2 = productitem['categories'][1]['displayname'] if len(productitem['categories']) >= 2 else ""
-            category_3 = productitem['categories'][2]['displayname'] if len(productitem['categories']) >= 3 else ""
-            category_4 = productitem['categories'][3]['displayname'] if len(productitem['categories']) >= 4 else ""
-            category_5 = productitem['categories'][4]['displayname'] if len(productitem['categories']) >= 5 else ""
-            sold = to_items['sold']
-            views = 0
-            rating = public_source['productreview'].get('ratingstar', 0)
-            if public_source['productreview'].get('ratingcount', 0):
-                rating_by = sum(public_source['productreview']['ratingcount'])
-            else:
-                rating_by = 0
-                
-            stock = to_items['stock']
-            size_image = ''
-            description = description.strip()
-            
-            new_data = {'url': url,
-                        'name': name,
-                        'price': price,
-                        'thumbnail_1': fix_url(thumbnail_1),
-                        'thumbnail_2': fix_url(thumbnail_2),
-                        'thumbnail_3': fix_url(thumbnail_3),
-                        'thumbnail_4': fix_url(thumbnail_4),
-                        'thumbnail_5': fix_url(thumbnail_5),
-                        'thumbnail_6': fix_url(thumbnail_6),
-                        'thumbnail_7': fix_url(thumbnail_7),
-                        'thumbnail_8': fix_url(thumbnail_8),
-                        'thumbnail_9': fix_url(thumbnail_9),
-                        'thumbnail_10': fix_url(thumbnail_10),
-                        'video': video,
-                        'description': description,
-                        'description_html': description_html,
-                        'weight': weight,
-                        'condition': condition,
-                        'min_order': min_order,
-                        'category_1': category_1,
-                        'category_2': category_2,
-                        'category_3': category_3,
-                        'category_4': category_4,
-                        'category_5': category_5,
-                        'sold': sold,
-                        'views': views,
-                        'rating': rating,
-                        'rating_by': rating_by,
-                        'stock': stock,
-                        'size_image': size_image}
-            
-            models = productitem['models']
-            tier_variations = productitem['tiervariations'] if 'tiervariations' in productitem else productitem['tier_variations']
-            for model in models:
-                if len(tier_variations) >= 1:
-                    v_stock = model['stock']
-                    v_price = math.ceil(int(str(model['price'])[:-5]) / 100) * 100
-                    tier_index = model['extinfo']['tierindex']
-                    v_image = ''
-                    v2_name = ''
-                    v2_value = ''
-                    if len(tier_variations) >= 2:
-                        v1_name = tier_variations[0]['name']
-                        v2_name = tier_variations[1]['name'] if len(tier_variations) >= 2 else ""
-                        if tier_variations[0]['images']:
-                            v_image = fix_url(tier_variations[0]['images'][tier_index[0]])
-                        if len(tier_variations[0]['options']) >= 1:
-                            v1_value = tier_variations[0]['options'][tier_index[0]]
-                        if v2_name and len(tier_variations[1]['options']) >= 1:
-                            v2_value = tier_variations[1]['options'][tier_index[1]]
-                    elif len(tier_variations) < 2:
-                        v1_name = tier_variations[0]['name']
-                        if tier_variations[0]['images']:
-                            v_image = fix_url(tier_variations[0]['images'][tier_index[0]])
-                        if len(tier_variations[0]['options']) >= 1:
-                            v1_value = tier_variations[0]['options'][tier_index[0]]
-                            
-                v_new_data = {
-                    'url': url,
-                    'v_stock': v_stock,
-                    'v_price': v_price,
-                    'v_image': v_image,
-                    'v1_name': v1_name,
-                    'v1_value': v1_value,
-                    'v2_name': v2_name,
-                    'v2_value': v2_value,
-                }
-                data_produk_variant.append(v_new_data)
-                
-            data_produk.append(new_data)
+def convert_pdc_to_qlobot(data: dict) -> dict:
+    to_items = data
+    images = data
+    public_source = to_items['public_source'] if 'public_source' in to_items else to_items['publicsource']
+    productitem = public_source['productitem']
+    url = data['url']
+    name: str = to_items['name']
+    price = to_items['price']
+    thumbnail_1 = to_items['image']
+    thumbnail_2 = fix_url(images['images'][1]) if len(images['images']) >= 2 else ""
+    thumbnail_3 = fix_url(images['images'][2]) if len(images['images']) >= 3 else ""
+    thumbnail_4 = fix_url(images['images'][3]) if len(images['images']) >= 4 else ""
+    thumbnail_5 = fix_url(images['images'][4]) if len(images['images']) >= 5 else ""
+    thumbnail_6 = fix_url(images['images'][5]) if len(images['images']) >= 6 else ""
+    thumbnail_7 = fix_url(images['images'][6]) if len(images['images']) >= 7 else ""
+    thumbnail_8 = fix_url(images['images'][7]) if len(images['images']) >= 8 else ""
+    thumbnail_9 = fix_url(images['images'][8]) if len(images['images']) >= 9 else ""
+    thumbnail_10 = fix_url(images['images'][9]) if len(images['images']) >= 10 else ""
+    video = ''
+    description: str = to_items['desc']
+    description_html = ''
+    weight = 0
+    if 'condition' in productitem:
+        condition = 'Baru' if productitem['condition'] == 1 else 'Bekas'
+    else:
+        condition = 'Baru'
+    min_order = 1
+    category_1 = productitem['categories'][0]['displayname'] if len(productitem['categories']) >= 1 else ""
+    category_2 = productitem['categories'][1]['displayname'] if len(productitem['categories']) >= 2 else ""
+    category_3 = productitem['categories'][2]['displayname'] if len(productitem['categories']) >= 3 else ""
+    category_4 = productitem['categories'][3]['displayname'] if len(productitem['categories']) >= 4 else ""
+    category_5 = productitem['categories'][4]['displayname'] if len(productitem['categories']) >= 5 else ""
+    sold = to_items['sold']
+    views = 0
+    rating = public_source['productreview'].get('ratingstar', 0)
+    if public_source['productreview'].get('ratingcount', 0):
+        rating_by = sum(public_source['productreview']['ratingcount'])
+    else:
+        rating_by = 0
+
+    stock = to_items['stock']
+    size_image = ''
+    description = description.strip()
+
+    new_data = {'url': url,
+                'name': name,
+                'price': price,
+                'thumbnail_1': fix_url(thumbnail_1),
+                'thumbnail_2': fix_url(thumbnail_2),
+                'thumbnail_3': fix_url(thumbnail_3),
+                'thumbnail_4': fix_url(thumbnail_4),
+                'thumbnail_5': fix_url(thumbnail_5),
+                'thumbnail_6': fix_url(thumbnail_6),
+                'thumbnail_7': fix_url(thumbnail_7),
+                'thumbnail_8': fix_url(thumbnail_8),
+                'thumbnail_9': fix_url(thumbnail_9),
+                'thumbnail_10': fix_url(thumbnail_10),
+                'video': video,
+                'description': description,
+                'description_html': description_html,
+                'weight': weight,
+                'condition': condition,
+                'min_order': min_order,
+                'category_1': category_1,
+                'category_2': category_2,
+                'category_3': category_3,
+                'category_4': category_4,
+                'category_5': category_5,
+                'sold': sold,
+                'views': views,
+                'rating': rating,
+                'rating_by': rating_by,
+                'stock': stock,
+                'size_image': size_image}
+
+    models = productitem['models']
+    tier_variations = productitem['tiervariations'] if 'tiervariations' in productitem else productitem['tier_variations']
+    variants = []
+    for model in models if len(tier_variations) >= 1 else []:
+        v_stock = model['stock']
+        v_price = math.ceil(int(str(model['price'])[:-5]) / 100) * 100
+        tier_index = model['extinfo']['tierindex']
+        v_image = ''
+        v1_name = tier_variations[0]['name']
+        v1_value = ''
+        v2_name = ''
+        v2_value = ''
+        if tier_variations[0]['images']:
+            v_image = fix_url(tier_variations[0]['images'][tier_index[0]])
+        if len(tier_variations[0]['options']) >= 1:
+            v1_value = tier_variations[0]['options'][tier_index[0]]
+        if len(tier_variations) >= 2:
+            v2_name = tier_variations[1]['name']
+            if v2_name and len(tier_variations[1]['options']) >= 1:
+                v2_value = tier_variations[1]['options'][tier_index[1]]
+                
+        variants.append({
+            'v_stock': v_stock,
+            'v_price': v_price,
+            'v_image': v_image,
+            'v1_name': v1_name,
+            'v1_value': v1_value,
+            'v2_name': v2_name,
+            'v2_value': v2_value,
+        })
+        
+    if variants:
+        new_data['v_name1'] = variants[0]['v1_name']
+        new_data['v_name2'] = variants[0]['v2_name']
+        
+        for i, variant in enumerate(variants[:100], start=1):
+            new_data[f'v{i}_value1'] = variant['v1_value']
+            new_data[f'v{i}_value2'] = variant['v2_value']
+            new_data[f'v{i}_price'] = variant['v_price']
+            new_data[f'v{i}_stock'] = variant['v_stock']
+            new_data[f'v{i}_image'] = variant['v_image']
             
-        except Exception as e:
+    return new_data
+
+def iter_qlobot_rows(data_list: Iterable[dict], total: int | None = None, progress: bool = True) -> Iterator[dict]:
+    for data in tqdm(data_list, desc='Convert Product', ncols=100, total=total, disable=not progress):
+        try:
+            row = convert_pdc_to_qlobot(expand_pdc(data))
+        except Exception:
             # traceback.print_exc()
             # print(e)
-            pass
-              
-    return data_produk, data_produk_variant
+            continue
+        
+        yield row
 
-def merge_product_variant(products: List[Dict], variants: List[Dict]) -> List[Dict]:
-    url_to_variants = defaultdict(list)
-    
-    for variant in variants:
-        url_to_variants[variant['url']].append(variant)
-    
-    result_merge = []
-    
-    for product in tqdm(products, desc='Combining Variations', ncols=100):
-        url = product['url']
+QLOBOT_FIELDNAMES = [
+    'url','name','price','thumbnail_1','thumbnail_2','thumbnail_3','thumbnail_4','thumbnail_5','thumbnail_6','thumbnail_7','thumbnail_8','thumbnail_9','thumbnail_10',
+    'video','description','description_html','weight','condition','min_order','category_1','category_2','category_3','category_4','category_5',
+    'sold','views','rating','rating_by','stock','size_image','v_name1','v_name2',
+    *[f'v{i}_{field}' for i in range(1, 101) for field in ['value1', 'value2', 'price', 'stock', 'image']]
+]
+
+class QlobotCsvWriter:
+    def __init__(self, result_path: str, max_product_per_csv: int | None = None, prefix: str | None = None) -> None:
+        self.result_path = result_path
+        self.max_product_per_csv = max_product_per_csv if max_product_per_csv and max_product_per_csv > 0 else None
+        self.prefix = prefix or f'products-{random.randint(10000, 99999)}'
+        self.paths: list[str] = []
+        self.csv_file = None
+        self.writer: csv.DictWriter | None = None
+        self.row_in_file = 0
+        self.row_count = 0
+        
+    def open_next_file(self):
+        self.close()
+        path_csv_file = f'{self.result_path}/{self.prefix}-{len(self.paths) + 1}.csv'
+        self.csv_file = open(path_csv_file, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.csv_file, fieldnames=QLOBOT_FIELDNAMES)
+        self.writer.writeheader()
+        self.paths.append(path_csv_file)
+        self.row_in_file = 0
         
-        if url in url_to_variants:
-            data_variants = url_to_variants[url]
-            variant_count = min(len(data_variants), 100) 
+    def write_row(self, row: dict[str, Any]):
+        if self.writer is None or (self.max_product_per_csv and self.row_in_file >= self.max_product_per_csv):
+            self.open_next_file()
             
-            product['v_name1'] = data_variants[0]['v1_name'] if variant_count >= 1 else ''
-            product['v_name2'] = data_variants[0]['v2_name'] if variant_count >= 1 else ''
+        self.writer.writerow(row)
+        self.row_in_file += 1
+        self.row_count += 1
+        
+    def write_rows(self, rows: Iterable[dict[str, Any]]):
+        for row in rows:
+            self.write_row(row)
+        
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+            self.writer = None
             
-            for i in range(1, variant_count + 1):
-                index = i - 1
-                product[f'v{i}_value1'] = data_variants[index]['v1_value']
-                product[f'v{i}_value2'] = data_variants[index]['v2_value']
-                product[f'v{i}_price'] = data_variants[index]['v_price']
-                product[f'v{i}_stock'] = data_variants[index]['v_stock']
-                product[f'v{i}_image'] = data_variants[index]['v_image']
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+        
+def get_qlobot_query(name_space: str | None) -> dict[str, Any]:
+    query: dict[str, Any] = {'marketplace': 'shopee', 'partial': {'$ne': True}}
+    if name_space:
+        query['namespace'] = name_space
         
-        result_merge.append(product)
+    return query
+
+def get_id_ranges(collection: Collection, query: dict[str, Any], shard_count: int) -> list[dict[str, Any]]:
+    buckets = list(collection.aggregate([
+        {'$match': query},
+        {'$bucketAuto': {'groupBy': '$_id', 'buckets': shard_count}}
+    ], allowDiskUse=True))
     
-    return result_merge
+    id_ranges = []
+    for index, bucket in enumerate(buckets):
+        if index + 1 < len(buckets):
+            id_ranges.append({'$gte': bucket['_id']['min'], '$lt': buckets[index + 1]['_id']['min']})
+        else:
+            id_ranges.append({'$gte': bucket['_id']['min'], '$lte': bucket['_id']['max']})
+            
+    return id_ranges
 
-def write_csv_file_qlobot(file_path: str, data: list[dict[str, Any]]):
-    header_exists = os.path.exists(file_path) and os.stat(file_path).st_size > 0
+def get_duplicate_urls(collection: Collection, query: dict[str, Any]) -> set[str]:
+    result = collection.aggregate([
+        {'$match': query},
+        {'$group': {'_id': '$url', 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+    return {data['_id'] for data in result}
 
-    with open(file_path, 'w', newline='', encoding='utf-8') as csv_file:
-        fieldnames = ['url','name','price','thumbnail_1','thumbnail_2','thumbnail_3','thumbnail_4','thumbnail_5','thumbnail_6','thumbnail_7','thumbnail_8','thumbnail_9','thumbnail_10','video','description','description_html','weight','condition','min_order','category_1','category_2','category_3','category_4','category_5','sold','views','rating','rating_by','stock','size_image','v_name1','v_name2','v1_value1','v1_value2','v1_price','v1_stock','v1_image','v2_value1','v2_value2','v2_price','v2_stock','v2_image','v3_value1','v3_value2','v3_price','v3_stock','v3_image','v4_value1','v4_value2','v4_price','v4_stock','v4_image','v5_value1','v5_value2','v5_price','v5_stock','v5_image','v6_value1','v6_value2','v6_price','v6_stock','v6_image','v7_value1','v7_value2','v7_price','v7_stock','v7_image','v8_value1','v8_value2','v8_price','v8_stock','v8_image','v9_value1','v9_value2','v9_price','v9_stock','v9_image','v10_value1','v10_value2','v10_price','v10_stock','v10_image','v11_value1','v11_value2','v11_price','v11_stock','v11_image','v12_value1','v12_value2','v12_price','v12_stock','v12_image','v13_value1','v13_value2','v13_price','v13_stock','v13_image','v14_value1','v14_value2','v14_price','v14_stock','v14_image','v15_value1','v15_value2','v15_price','v15_stock','v15_image','v16_value1','v16_value2','v16_price','v16_stock','v16_image','v17_value1','v17_value2','v17_price','v17_stock','v17_image','v18_value1','v18_value2','v18_price','v18_stock','v18_image','v19_value1','v19_value2','v19_price','v19_stock','v19_image','v20_value1','v20_value2','v20_price','v20_stock','v20_image','v21_value1','v21_value2','v21_price','v21_stock','v21_image','v22_value1','v22_value2','v22_price','v22_stock','v22_image','v23_value1','v23_value2','v23_price','v23_stock','v23_image','v24_value1','v24_value2','v24_price','v24_stock','v24_image','v25_value1','v25_value2','v25_price','v25_stock','v25_image','v26_value1','v26_value2','v26_price','v26_stock','v26_image','v27_value1','v27_value2','v27_price','v27_stock','v27_image','v28_value1','v28_value2','v28_price','v28_stock','v28_image','v29_value1','v29_value2','v29_price','v29_stock','v29_image','v30_value1','v30_value2','v30_price','v30_stock','v30_image','v31_value1','v31_value2','v31_price','v31_stock','v31_image','v32_value1','v32_value2','v32_price','v32_stock','v32_image','v33_value1','v33_value2','v33_price','v33_stock','v33_image','v34_value1','v34_value2','v34_price','v34_stock','v34_image','v35_value1','v35_value2','v35_price','v35_stock','v35_image','v36_value1','v36_value2','v36_price','v36_stock','v36_image','v37_value1','v37_value2','v37_price','v37_stock','v37_image','v38_value1','v38_value2','v38_price','v38_stock','v38_image','v39_value1','v39_value2','v39_price','v39_stock','v39_image','v40_value1','v40_value2','v40_price','v40_stock','v40_image','v41_value1','v41_value2','v41_price','v41_stock','v41_image','v42_value1','v42_value2','v42_price','v42_stock','v42_image','v43_value1','v43_value2','v43_price','v43_stock','v43_image','v44_value1','v44_value2','v44_price','v44_stock','v44_image','v45_value1','v45_value2','v45_price','v45_stock','v45_image','v46_value1','v46_value2','v46_price','v46_stock','v46_image','v47_value1','v47_value2','v47_price','v47_stock','v47_image','v48_value1','v48_value2','v48_price','v48_stock','v48_image','v49_value1','v49_value2','v49_price','v49_stock','v49_image','v50_value1','v50_value2','v50_price','v50_stock','v50_image','v51_value1','v51_value2','v51_price','v51_stock','v51_image','v52_value1','v52_value2','v52_price','v52_stock','v52_image','v53_value1','v53_value2','v53_price','v53_stock','v53_image','v54_value1','v54_value2','v54_price','v54_stock','v54_image','v55_value1','v55_value2','v55_price','v55_stock','v55_image','v56_value1','v56_value2','v56_price','v56_stock','v56_image','v57_value1','v57_value2','v57_price','v57_stock','v57_image','v58_value1','v58_value2','v58_price','v58_stock','v58_image','v59_value1','v59_value2','v59_price','v59_stock','v59_image','v60_value1','v60_value2','v60_price','v60_stock','v60_image','v61_value1','v61_value2','v61_price','v61_stock','v61_image','v62_value1','v62_value2','v62_price','v62_stock','v62_image','v63_value1','v63_value2','v63_price','v63_stock','v63_image','v64_value1','v64_value2','v64_price','v64_stock','v64_image','v65_value1','v65_value2','v65_price','v65_stock','v65_image','v66_value1','v66_value2','v66_price','v66_stock','v66_image','v67_value1','v67_value2','v67_price','v67_stock','v67_image','v68_value1','v68_value2','v68_price','v68_stock','v68_image','v69_value1','v69_value2','v69_price','v69_stock','v69_image','v70_value1','v70_value2','v70_price','v70_stock','v70_image','v71_value1','v71_value2','v71_price','v71_stock','v71_image','v72_value1','v72_value2','v72_price','v72_stock','v72_image','v73_value1','v73_value2','v73_price','v73_stock','v73_image','v74_value1','v74_value2','v74_price','v74_stock','v74_image','v75_value1','v75_value2','v75_price','v75_stock','v75_image','v76_value1','v76_value2','v76_price','v76_stock','v76_image','v77_value1','v77_value2','v77_price','v77_stock','v77_image','v78_value1','v78_value2','v78_price','v78_stock','v78_image','v79_value1','v79_value2','v79_price','v79_stock','v79_image','v80_value1','v80_value2','v80_price','v80_stock','v80_image','v81_value1','v81_value2','v81_price','v81_stock','v81_image','v82_value1','v82_value2','v82_price','v82_stock','v82_image','v83_value1','v83_value2','v83_price','v83_stock','v83_image','v84_value1','v84_value2','v84_price','v84_stock','v84_image','v85_value1','v85_value2','v85_price','v85_stock','v85_image','v86_value1','v86_value2','v86_price','v86_stock','v86_image','v87_value1','v87_value2','v87_price','v87_stock','v87_image','v88_value1','v88_value2','v88_price','v88_stock','v88_image','v89_value1','v89_value2','v89_price','v89_stock','v89_image','v90_value1','v90_value2','v90_price','v90_stock','v90_image','v91_value1','v91_value2','v91_price','v91_stock','v91_image','v92_value1','v92_value2','v92_price','v92_stock','v92_image','v93_value1','v93_value2','v93_price','v93_stock','v93_image','v94_value1','v94_value2','v94_price','v94_stock','v94_image','v95_value1','v95_value2','v95_price','v95_stock','v95_image','v96_value1','v96_value2','v96_price','v96_stock','v96_image','v97_value1','v97_value2','v97_price','v97_stock','v97_image','v98_value1','v98_value2','v98_price','v98_stock','v98_image','v99_value1','v99_value2','v99_price','v99_stock','v99_image','v100_value1','v100_value2','v100_price','v100_stock','v100_image']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+def init_worker_process():
+    global mongo_client
+    # MongoClient is not fork-safe, each worker opens its own
+    mongo_client = None
 
-        if not header_exists:
-            writer.writeheader()
+def convert_qlobot_shard(shard_index: int, query: dict[str, Any], result_path: str, max_product_per_csv: int | None, prefix: str, duplicate_urls: set[str]) -> dict[str, Any]:
+    collection = get_collection()
+    data = collection.find(query, QLOBOT_PROJECTION, batch_size=get_db_config().batch_size).sort('_id', 1)
+    duplicate_in_file: dict[str, list[str]] = defaultdict(list)
+    with QlobotCsvWriter(result_path, max_product_per_csv, prefix=f'{prefix}-{shard_index + 1:02d}') as writer:
+        for row in iter_unique_dict(iter_qlobot_rows(data, progress=False)):
+            writer.write_row(row)
+            if row['url'] in duplicate_urls:
+                duplicate_in_file[writer.paths[-1]].append(row['url'])
+                
+    return {'shard_index': shard_index, 'paths': writer.paths, 'row_count': writer.row_count, 'duplicate_in_file': dict(duplicate_in_file)}
 
-        writer.writerows(data)
+def remove_rows_from_csv_qlobot(file_path: str, urls: set[str]) -> int:
+    tmp_path = f'{file_path}.tmp'
+    removed = 0
+    with open(file_path, 'r', newline='', encoding='utf-8') as csv_in, open(tmp_path, 'w', newline='', encoding='utf-8') as csv_out:
+        writer = csv.DictWriter(csv_out, fieldnames=QLOBOT_FIELDNAMES)
+        writer.writeheader()
+        for row in csv.DictReader(csv_in):
+            if row['url'] in urls:
+                removed += 1
+                continue
+            
+            writer.writerow(row)
+            
+    os.replace(tmp_path, file_path)
+    return removed
+
+def reconcile_qlobot_shards(shard_results: list[dict[str, Any]]) -> int:
+    seen_urls = set()
+    removed = 0
+    for shard_result in sorted(shard_results, key=lambda x: x['shard_index']):
+        for path_csv_file in shard_result['paths']:
+            urls = shard_result['duplicate_in_file'].get(path_csv_file, [])
+            if already_written := seen_urls.intersection(urls):
+                removed += remove_rows_from_csv_qlobot(path_csv_file, already_written)
+                
+            seen_urls.update(urls)
+            
+    return removed
+
+def convert_items_to_qlobot_parallel(collection: Collection, query: dict[str, Any], result_path: str, max_product_per_csv: int | None, process_count: int) -> tuple[list[str], int]:
+    prefix = f'products-{random.randint(10000, 99999)}'
+    print('split collection...')
+    id_ranges = get_id_ranges(collection, query, process_count)
+    duplicate_urls = get_duplicate_urls(collection, query)
     
+    shard_results: list[dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=process_count, initializer=init_worker_process) as executor:
+        futures = [
+            executor.submit(convert_qlobot_shard, shard_index, {**query, '_id': id_range}, result_path, max_product_per_csv, prefix, duplicate_urls)
+            for shard_index, id_range in enumerate(id_ranges)
+        ]
+        for future in tqdm(as_completed(futures), desc='Convert Shard', ncols=100, total=len(futures)):
+            shard_results.append(future.result())
+    
+    print('filtering duplicate product...')
+    removed = reconcile_qlobot_shards(shard_results)
+    paths = [path for shard_result in sorted(shard_results, key=lambda x: x['shard_index']) for path in shard_result['paths']]
+    return paths, sum(shard_result['row_count'] for shard_result in shard_results) - removed
+
 def get_convert_items_from_db_to_qlobot(result_path = './qlobot_collection'):
     print('connect to mongodb...')
-    cursor = get_cursor()
-    try:
-        name_space = str(input('masukkan namespace (default: semua produk shopee): ')).strip()
-        print('get items...')
-        if not name_space:
-            raise ValueError('namespace')
-        
-        data: list[dict] = [c for c in cursor if c and 'marketplace' in c and c['marketplace'] == 'shopee' and c['namespace'] == name_space]
-    except:
-        data: list[dict] = [c for c in cursor if c and 'marketplace' in c and c['marketplace'] == 'shopee']
+    collection = get_collection()
+    ensure_indexes(collection)
+    name_space = str(input('masukkan namespace (default: semua produk shopee): ')).strip()
+    print('get items...')
+    query = get_qlobot_query(name_space)
+    total_product = collection.count_documents(query)
+    total_partial = collection.count_documents({**query, 'partial': True})
+    if total_partial:
+        print(f'{total_partial} product belum lengkap (mode search_list) tidak ikut di convert, jalankan "py main.py backfill" dulu')
         
     try:
-        max_product_per_csv = int(input(f'max product per csv (default: semua produk shopee [{len(data)}]): '))
+        max_product_per_csv = int(input(f'max product per csv (default: semua produk shopee [{total_product}]): '))
         if not max_product_per_csv:
             raise ValueError('max_product_per_csv')
     except:
         max_product_per_csv = None
+        
+    try:
+        process_count = int(input(f'jumlah proses (default: 1, max: {os.cpu_count()}): '))
+        if process_count < 1:
+            raise ValueError('process_count')
+    except:
+        process_count = 1
     
-    products, variants = filter_collection_from_pdc(data)
-    result_m = merge_product_variant(products, variants)
-    print('filtering duplicate product...')
-    result = filter_duplicates_list_dict(result_m)
-    
-    if isinstance(max_product_per_csv, int) and max_product_per_csv > 0:
-        for i in range(0, len(result), max_product_per_csv):
-            pecahan = result[i:i + max_product_per_csv]
-            path_csv_file = f'{result_path}/products-{random.randint(10000, 99999)}.csv'
-            write_csv_file_qlobot(path_csv_file, pecahan)
-            print(path_csv_file)
+    if process_count > 1:
+        paths, row_count = convert_items_to_qlobot_parallel(collection, query, result_path, max_product_per_csv, process_count)
+        
     else:
-        path_csv_file = f'{result_path}/products-{random.randint(10000, 99999)}.csv'
-        write_csv_file_qlobot(path_csv_file, result)
+        data = collection.find(query, QLOBOT_PROJECTION, batch_size=get_db_config().batch_size)
+        with QlobotCsvWriter(result_path, max_product_per_csv) as writer:
+            writer.write_rows(iter_unique_dict(iter_qlobot_rows(data, total=total_product)))
+            
+        paths, row_count = writer.paths, writer.row_count
+        
+    for path_csv_file in paths:
         print(path_csv_file)
+        
+    print(f'total product: {row_count}')
     
 
+# ================================ RAW ARCHIVE ================================
+
+class RawArchiveWriter:
+    def __init__(self, path: str, segment_size: int = 64 * 1024 * 1024, compression: Literal['gzip', 'zstd'] = 'gzip', max_queue: int = 500) -> None:
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('raw archive zstd membutuhkan "zstandard": pip install zstandard')
+        
+        self.path = path
+        self.segment_size = segment_size
+        self.ext = '.jsonl.zst' if compression == 'zstd' else '.jsonl.gz'
+        self.compressor = zstandard.ZstdCompressor(level=3) if compression == 'zstd' else None
+        self.segment_count = 0
+        self.segment = None
+        self.index = None
+        self.queue: asyncio.Queue[tuple[str, str, dict, list[int]] | None] = asyncio.Queue(maxsize=max_queue)
+        self.task: asyncio.Task | None = None
+        os.makedirs(path, exist_ok=True)
+        
+    def compress(self, raw: bytes) -> bytes:
+        # every record is a complete gzip member / zstd frame, so it can be read alone from its offset
+        return self.compressor.compress(raw) if self.compressor is not None else gzip.compress(raw, compresslevel=6)
+        
+    def open_segment(self):
+        self.close_segment()
+        self.segment_count += 1
+        name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{self.segment_count:04d}'
+        self.segment = open(os.path.join(self.path, f'{name}{self.ext}'), 'wb')
+        self.index = open(os.path.join(self.path, f'{name}.idx'), 'w', encoding='utf-8')
+        
+    def write(self, kind: Literal['get_pc', 'search_items'], namespace: str, data: dict, item_ids: list[int]):
+        record = {'type': kind, 'namespace': namespace, 'time': time.time(), 'data': data}
+        compressed = self.compress((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        if self.segment is None or self.segment.tell() + len(compressed) > self.segment_size:
+            self.open_segment()
+            
+        offset = self.segment.tell()
+        self.segment.write(compressed)
+        self.segment.flush()
+        for item_id in item_ids:
+            self.index.write(json.dumps({'itemid': item_id, 'type': kind, 'namespace': namespace, 'offset': offset, 'length': len(compressed)}) + '\n')
+            
+        self.index.flush()
+        
+    def close_segment(self):
+        for f in (self.segment, self.index):
+            if f is not None:
+                f.close()
+                
+        self.segment = None
+        self.index = None
+        
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        
+    async def put(self, kind: Literal['get_pc', 'search_items'], namespace: str, data: dict, item_ids: list[int]):
+        await self.queue.put((kind, namespace, data, item_ids))
+        
+    async def run(self):
+        while True:
+            record = await self.queue.get()
+            if record is None:
+                break
+            
+            try:
+                # compression and file writes stay off the event loop
+                await asyncio.to_thread(self.write, *record)
+            except Exception as e:
+                print(f'error raw archive: {e}')
+                
+    async def close(self):
+        if self.task is not None:
+            if not self.task.done():
+                await self.queue.put(None)
+                
+            await self.task
+            self.task = None
+            
+        self.close_segment()
+
+raw_archive: RawArchiveWriter | None = None
+
+def get_raw_archive() -> RawArchiveWriter | None:
+    global raw_archive
+    db_config = get_db_config()
+    if raw_archive is None and db_config.raw_archive:
+        raw_archive = RawArchiveWriter(db_config.raw_archive_path, db_config.raw_archive_segment_size, db_config.raw_archive_compression, db_config.writer_max_queue)
+        raw_archive.start()
+        
+    return raw_archive
+
+async def close_raw_archive():
+    global raw_archive
+    if raw_archive is not None:
+        await raw_archive.close()
+        raw_archive = None
+
+async def archive_raw_response(kind: Literal['get_pc', 'search_items'], namespace: str, data: dict):
+    try:
+        archive = get_raw_archive()
+        if archive is None:
+            return
+        
+        if kind == 'get_pc':
+            item_ids = [data['data']['item']['item_id']] if data.get('data') else []
+        else:
+            item_ids = [item['item_basic']['itemid'] for item in data.get('items') or [] if item.get('item_basic')]
+            
+        if item_ids:
+            await archive.put(kind, namespace, data, item_ids)
+    except Exception as e:
+        print(f'error raw archive: {e}')
+
+def get_raw_archive_segments(path: str) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(('.jsonl.gz', '.jsonl.zst')))
+
+def load_raw_archive_index(path: str, kind: Literal['get_pc', 'search_items'] = 'get_pc', name_space: str | None = None) -> dict[int, dict[str, Any]]:
+    # later segments win, so each item id points to its latest capture
+    index = {}
+    for segment_path in get_raw_archive_segments(path):
+        index_path = segment_path.rsplit('.jsonl', 1)[0] + '.idx'
+        if not os.path.exists(index_path):
+            continue
+        
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                
+                entry = json.loads(line)
+                if entry['type'] != kind or (name_space and entry['namespace'] != name_space):
+                    continue
+                
+                entry['segment'] = segment_path
+                index[entry['itemid']] = entry
+                
+    return index
+
+class RawArchiveReader:
+    def __init__(self) -> None:
+        self.maps: dict[str, tuple[Any, mmap.mmap]] = {}
+        
+    def get_map(self, segment_path: str, end: int) -> mmap.mmap:
+        if segment_path in self.maps and len(self.maps[segment_path][1]) < end:
+            self.close_map(segment_path)
+            
+        if segment_path not in self.maps:
+            f = open(segment_path, 'rb')
+            self.maps[segment_path] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            
+        return self.maps[segment_path][1]
+        
+    def read(self, segment_path: str, offset: int, length: int) -> dict:
+        raw = self.get_map(segment_path, offset + length)[offset:offset + length]
+        if segment_path.endswith('.zst'):
+            if zstandard is None:
+                raise ImportError('raw archive zstd membutuhkan "zstandard": pip install zstandard')
+            
+            return json.loads(zstandard.ZstdDecompressor().decompress(raw))
+        
+        return json.loads(gzip.decompress(raw))
+    
+    def read_entry(self, entry: dict[str, Any]) -> dict:
+        return self.read(entry['segment'], entry['offset'], entry['length'])
+    
+    def close_map(self, segment_path: str):
+        f, mm = self.maps.pop(segment_path)
+        mm.close()
+        f.close()
+        
+    def close(self):
+        for segment_path in list(self.maps):
+            self.close_map(segment_path)
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+def get_raw_archive_entries(path: str, name_space: str | None = None) -> list[dict[str, Any]]:
+    index = load_raw_archive_index(path, 'get_pc', name_space)
+    return sorted(index.values(), key=lambda entry: (entry['segment'], entry['offset']))
+
+def reprocess_chunk(chunk: list[dict], source: Literal['archive', 'raw'], target: Literal['mongodb', 'qlobot'], target_name_space: str | None) -> tuple[int, Any]:
+    products = []
+    if source == 'archive':
+        with RawArchiveReader() as reader:
+            for entry in chunk:
+                try:
+                    record = reader.read_entry(entry)
+                    products.append(convert_product_shopee_to_pdc(record['data'], namespace=target_name_space or record['namespace']))
+                except Exception as e:
+                    print(f'error reprocess {entry["itemid"]}: {e}')
+                    
+    else:
+        for payload in chunk:
+            try:
+                products.append(convert_product_shopee_to_pdc(payload, namespace=target_name_space, from_data='data' in payload))
+            except Exception as e:
+                print(f'error reprocess: {e}')
+                
+    if target == 'qlobot':
+        return len(chunk), list(iter_qlobot_rows(products, progress=False))
+    
+    return len(chunk), upsert_items_to_db(get_collection(), products)
+
+def iter_reprocess_results(chunks: Iterable[list[dict]], process_count: int, source: Literal['archive', 'raw'], target: Literal['mongodb', 'qlobot'], target_name_space: str | None) -> Iterator[tuple[int, Any]]:
+    if process_count <= 1:
+        for chunk in chunks:
+            yield reprocess_chunk(chunk, source, target, target_name_space)
+            
+        return
+    
+    with ProcessPoolExecutor(max_workers=process_count, initializer=init_worker_process) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(reprocess_chunk, chunk, source, target, target_name_space))
+            # keep a bounded number of chunks in flight so a big source is never fully loaded in memory
+            if len(pending) >= process_count * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    
+        for future in as_completed(pending):
+            yield future.result()
+
+def main_reprocess(result_path: str = './qlobot_collection'):
+    try:
+        db_config = get_db_config()
+        source = str(input('sumber data:\n1. raw archive\n2. file json/jsonl (pdp)\n3. collection mongodb (pdp)\npilih (default: 1): ')).strip()
+        if source == '2':
+            path_file = str(input('path file: ')).strip()
+            chunks = iter_chunks(iter_json_file(path_file), db_config.batch_size)
+            source_kind, total = 'raw', None
+            
+        elif source == '3':
+            raw_collection = get_collection(str(input('nama collection: ')).strip())
+            chunks = iter_chunks(raw_collection.find({}, {'_id': 0}, batch_size=db_config.batch_size), db_config.batch_size)
+            source_kind, total = 'raw', raw_collection.estimated_document_count()
+            
+        else:
+            segments = get_raw_archive_segments(db_config.raw_archive_path)
+            print(f'raw archive: {len(segments)} segment di {db_config.raw_archive_path}')
+            name_space = str(input('namespace raw archive (default: semua): ')).strip()
+            entries = get_raw_archive_entries(db_config.raw_archive_path, name_space or None)
+            chunks = iter_chunks(entries, db_config.batch_size)
+            source_kind, total = 'archive', len(entries)
+            
+        target = 'qlobot' if str(input('reprocess ke:\n1. mongodb\n2. qlobot csv\npilih (default: 1): ')).strip() == '2' else 'mongodb'
+        if source_kind == 'archive':
+            target_name_space = str(input('namespace tujuan (default: sama dengan saat scrape): ')).strip() or None
+        else:
+            target_name_space = str(input('namespace tujuan: ')).strip() or f'collection_{datetime.now().strftime("%d_%m_%Y")}'
+            
+        try:
+            process_count = int(input(f'jumlah proses (default: {os.cpu_count()}): '))
+            if process_count < 1:
+                raise ValueError('process_count')
+        except:
+            process_count = os.cpu_count() or 1
+            
+        if target == 'mongodb':
+            ensure_indexes(get_collection())
+            
+        start = time.time()
+        count = 0
+        results = iter_reprocess_results(chunks, process_count, source_kind, target, target_name_space)
+        with tqdm(total=total, desc='Reprocess', ncols=100, unit='rec') as progress:
+            if target == 'qlobot':
+                def iter_rows() -> Iterator[dict]:
+                    nonlocal count
+                    for chunk_count, rows in results:
+                        count += chunk_count
+                        progress.update(chunk_count)
+                        yield from rows
+                        
+                with QlobotCsvWriter(result_path) as writer:
+                    writer.write_rows(iter_unique_dict(iter_rows()))
+                    
+            else:
+                status = Counter({'upserted': 0, 'modified': 0, 'error': 0})
+                for chunk_count, chunk_status in results:
+                    count += chunk_count
+                    progress.update(chunk_count)
+                    status.update(chunk_status)
+                    
+        elapsed = max(time.time() - start, 0.001)
+        print(f'reprocess selesai: {count} record dalam {elapsed:.1f} detik ({count / elapsed:.0f} rec/s)')
+        if target == 'qlobot':
+            for path_csv_file in writer.paths:
+                print(path_csv_file)
+                
+            print(f'total product: {writer.row_count}')
+            
+        else:
+            rebuild_namespace_summary(get_collection())
+            print(dict(status))
+            
+    except:
+        traceback.print_exc()
+
+
 # ================================ COLLECTION MANAGER ================================
 
 class CollectionManager:
@@ -463,84 +1336,92 @@ class CollectionManager:
         self.all_name_space = {}
         
     def get_all_name_space(self):
-        return dict(Counter([name['namespace'] for name in get_cursor() if 'namespace' in name]))
+        return {name_space: stat['count'] for name_space, stat in get_namespace_summary(get_collection()).items()}
+    
+    def print_name_space_stats(self):
+        for name_space, stat in get_namespace_summary(get_collection()).items():
+            last_inserted = stat['last_inserted'].strftime("%d/%m/%Y %H:%M:%S") if stat.get('last_inserted') else '-'
+            print(f'{name_space}: {stat["count"]} product | {stat.get("shop_count", 0)} toko | harga {stat.get("price_min")} - {stat.get("price_max")} | terakhir insert {last_inserted}')
+    
+    def has_name_space(self, name_space: str) -> bool:
+        if name_space in self.all_name_space:
+            return True
+        
+        return get_collection().find_one({'namespace': name_space}, {'_id': 1}) is not None
     
     def delete_col_by_name_space(self, name_space: str) -> int:
-        if name_space in list(self.all_name_space.keys()):
-            rslt_delete = get_cursor().collection.delete_many({'namespace': name_space})
+        if self.has_name_space(name_space):
+            collection = get_collection()
+            rslt_delete = collection.delete_many({'namespace': name_space})
+            delete_namespace_summary(collection, name_space)
             return rslt_delete.deleted_count
         
         print(f'"{name_space}" not found')
         return 0
     
-    def filter_collection(self) -> list[dict]:
-        list_data = []
-        for col in get_cursor():
-            del col['_id']
+    def filter_collection(self, name_space: str) -> Iterator[dict]:
+        query = {} if name_space == 'ALL' else {'namespace': name_space.strip()}
+        collection = get_collection()
+        data = collection.find(query, {'_id': 0}, batch_size=get_db_config().batch_size)
+        total = collection.count_documents(query) if query else collection.estimated_document_count()
+        for col in tqdm(data, desc='Export', ncols=100, total=total):
             col['processed'] = False
-            list_data.append(col)
-            
-        return list_data
+            yield expand_pdc(col)
     
-    def save_to_json_file(self, data: Any,  path: str):
-        with open(path, 'w') as f:
-            json.dump(data, f)
+    def save_to_json_file(self, data: Iterable[dict],  path: str) -> int:
+        is_json_lines = '.jsonl' in os.path.basename(path)
+        count = 0
+        with open_file_by_ext(path, 'w') as f:
+            if not is_json_lines:
+                f.write('[')
+                
+            for chunk in iter_chunks(data, get_db_config().batch_size):
+                lines = [json.dumps(col, default=str) for col in chunk]
+                if is_json_lines:
+                    f.write('\n'.join(lines) + '\n')
+                else:
+                    f.write((', ' if count else '') + ', '.join(lines))
+                    
+                count += len(chunk)
+                
+            if not is_json_lines:
+                f.write(']')
+                
+        return count
     
     def export_collection(self, name_space: str, path_export: str):
-        collection = self.filter_collection()
-        if name_space == 'ALL':
-            self.save_to_json_file(collection, path_export)
-            return True
-        elif name_space in list(self.all_name_space.keys()):
-            data = [col for col in collection if col['namespace'] == name_space.strip()]
-            self.save_to_json_file(data, path_export)
+        if name_space == 'ALL' or self.has_name_space(name_space):
+            count = self.save_to_json_file(self.filter_collection(name_space), path_export)
+            print(f'exported: {count} product')
             return True
         
         print(f'"{name_space}" not found')
         return False
         
+    def prepare_pdc_item(self, col: dict, name_space: str) -> dict:
+        if '_id' in col:
+            del col['_id']
+            
+        col['namespace'] = name_space
+        return col
+        
     def import_collection_from_file(self, mode: Literal['pdc', 'pdp'], path_file: str, name_space: str | None):
         if os.path.exists(path_file):
-            with open(path_file, 'r') as f:
-                data: list[dict] = json.load(f)
-                
-            cursor = get_cursor()
+            data = iter_json_file(path_file)
+            collection = get_collection()
             names_space_date_or_input = f'collection_{datetime.now().strftime("%d_%m_%Y")}' if not name_space else name_space
-            if isinstance(data, list):
-                if mode == 'pdc':
-                    issuccess = 0
-                    for col in data:
-                        if '_id' in col:
-                            del col['_id']
-                            
-                        col['namespace'] = names_space_date_or_input
-                            
-                        rslt = insert_one_item_to_db(cursor, col)
-                        if rslt:
-                            issuccess += 1
-                            
-                    return issuccess
-                
-                elif mode == 'pdp':
-                    issuccess = 0
-                    for col in data:
-                        if '_id' in col:
-                            del col['_id']
-                            
-                        col['namespace'] = names_space_date_or_input
-                            
-                        product = convert_product_shopee_to_pdc(col, namespace=names_space_date_or_input, from_data=True if 'data' in col else False)
-                        rslt = insert_one_item_to_db(cursor, product)
-                        if rslt:
-                            issuccess += 1
-                        
-                    return issuccess
+            if mode == 'pdc':
+                products = (self.prepare_pdc_item(col, names_space_date_or_input) for col in data)
+            
+            elif mode == 'pdp':
+                products = (convert_product_shopee_to_pdc(col, namespace=names_space_date_or_input, from_data=True if 'data' in col else False) for col in data)
 
-                else:
-                    raise ValueError(f'invalid mode: {mode}')
-                
             else:
-                print(f'file harus format Array / List "[]"')
+                raise ValueError(f'invalid mode: {mode}')
+            
+            status = insert_batches_to_db(collection, products)
+            print(f'duplikat: {status["duplicate"]} | error: {status["error"]}')
+            return status['inserted']
                 
         else:
             print(f'"{path_file}" file not found')
@@ -548,17 +1429,18 @@ class CollectionManager:
         return 0
         
     def main_usage(self):
+        ensure_indexes(get_collection())
         self.all_name_space = self.get_all_name_space()
         while True:
             try:
-                items = ['get all count collection', 'export collection', 'import collection from file', 'delete collection by namespace', 'export to qlobot', 'exit']
+                items = ['get all count collection', 'export collection', 'import collection from file', 'delete collection by namespace', 'export to qlobot', 'rebuild namespace summary', 'exit']
                 for no, select in enumerate(items, start=1):
                     print(f'{no}. {select.capitalize()}')
                 
                 selected_user = int(input('\npilih nomor: '))
                 if selected_user == 1:
                     self.all_name_space = self.get_all_name_space()
-                    print(self.all_name_space)
+                    self.print_name_space_stats()
                     
                 elif selected_user == 2:
                     try:
@@ -568,7 +1450,7 @@ class CollectionManager:
                     except:
                         name_space = 'ALL'
                     try:
-                        path_export = str(input('masukkan path export (default: "result_product.json"): '))
+                        path_export = str(input('masukkan path export, format .json / .jsonl / .jsonl.gz / .jsonl.zst (default: "result_product.json"): '))
                         if not path_export:
                             raise ValueError('path_export')
                     except:
@@ -608,6 +1490,11 @@ class CollectionManager:
                     get_convert_items_from_db_to_qlobot()
                 
                 elif selected_user == 6:
+                    rebuild_namespace_summary(get_collection())
+                    self.all_name_space = self.get_all_name_space()
+                    self.print_name_space_stats()
+                
+                elif selected_user == 7:
                     break
                 
                 print('\n')
@@ -739,6 +1626,42 @@ class FilterDataModel(BaseModel):
     min_rating: float
     max_page_scrape: int = 9
     name_space: str = 'tes_scrape'
+    max_account_concurrent: int = 1
+    max_url_per_account: int = 1
+    max_retry_url: int = 3
+    persistent_session: bool = True
+    scrape_mode: Literal['click', 'tab', 'search_list'] = 'click'
+    max_product_tabs: int = 4
+    prefetch_next_page: bool = True
+    rate_limit_initial: float = 0.5
+    rate_limit_min: float = 0.05
+    rate_limit_max: float = 2.0
+    rate_limit_global_max: float = 5.0
+    rate_limit_increase: float = 0.02
+    rate_limit_decrease: float = 0.5
+    account_cooldown: int = 1800
+    account_cooldown_max: int = 21600
+    job_lease_seconds: int = 600
+    headless: bool = False
+    block_resource_types: List[str] = ['image', 'media', 'font']
+    block_url_patterns: List[str] = ['google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'facebook.net', 'facebook.com/tr', 'analytics.tiktok.com', 'bat.bing.com', 'criteo']
+
+class DatabaseConfigModel(BaseModel):
+    host: str = 'localhost'
+    port: int = 27017
+    database: str = 'kampretcode2'
+    collection: str = 'item'
+    max_pool_size: int = 20
+    batch_size: int = 1000
+    writer_batch_size: int = 50
+    writer_flush_interval: float = 2.0
+    writer_max_queue: int = 500
+    item_index_refresh_interval: int = 300
+    compact_storage: bool = False
+    raw_archive: bool = True
+    raw_archive_path: str = './data/raw_archive'
+    raw_archive_segment_size: int = 64 * 1024 * 1024
+    raw_archive_compression: Literal['gzip', 'zstd'] = 'gzip'
 
 
 # ================================ UTILS ================================
@@ -781,6 +1704,10 @@ def create_not_exist_file():
         with open(path, 'w') as f:
             json.dump(filter_data.model_dump(), f, indent=4)
             
+    if not os.path.exists(path:='./data/db_config.json'):
+        with open(path, 'w') as f:
+            json.dump(DatabaseConfigModel().model_dump(), f, indent=4)
+            
     if not os.path.exists(path:='./akun.txt'):
         is_exist = False
         with open(path, 'w') as f:
@@ -793,6 +1720,99 @@ def create_not_exist_file():
             
     return is_exist
 
+loaded_db_config: DatabaseConfigModel | None = None
+
+def get_db_config() -> DatabaseConfigModel:
+    global loaded_db_config
+    if loaded_db_config is None:
+        loaded_db_config = DatabaseConfigModel()
+        if os.path.exists(path:='./data/db_config.json'):
+            with open(path, 'r') as f:
+                loaded_db_config = DatabaseConfigModel(**json.load(f))
+                
+    return loaded_db_config
+
+def open_file_by_ext(path: str, mode: str = 'r'):
+    encoding = None if 'b' in mode else 'utf-8'
+    if path.endswith('.gz'):
+        return gzip.open(path, mode if 'b' in mode else f'{mode}t', encoding=encoding)
+    
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('file .zst membutuhkan "zstandard": pip install zstandard')
+        
+        if 'r' in mode:
+            reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+            return reader if 'b' in mode else io.TextIOWrapper(reader, encoding=encoding)
+        
+        return zstandard.open(path, mode if 'b' in mode else f'{mode}t', encoding=encoding)
+    
+    return open(path, mode, encoding=encoding)
+
+def iter_json_file(path: str, chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+    # yields the items of a top-level json array or json lines file one by one
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    read_size = chunk_size
+    is_array = None
+    is_eof = False
+    
+    total = None if path.endswith(('.gz', '.zst')) else os.path.getsize(path)
+    with open_file_by_ext(path, 'rb') as f, tqdm(total=total, desc='Read File', ncols=100, unit='B', unit_scale=True) as progress:
+        def read_more():
+            nonlocal buffer, position, is_eof
+            chunk = f.read(read_size)
+            progress.update(len(chunk))
+            if not chunk:
+                is_eof = True
+                
+            buffer = buffer[position:] + text_decoder.decode(chunk, final=is_eof)
+            position = 0
+            
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+                
+            if position >= len(buffer):
+                if is_eof:
+                    break
+                
+                read_more()
+                continue
+            
+            if is_array is None:
+                is_array = buffer[position] == '['
+                if is_array:
+                    position += 1
+                    continue
+                
+            if is_array and buffer[position] == ']':
+                break
+            
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                if end == len(buffer) and not is_eof:
+                    raise ValueError('item may be truncated')
+                
+            except ValueError:
+                if is_eof:
+                    raise
+                
+                read_size = max(chunk_size, len(buffer) - position)
+                read_more()
+                continue
+            
+            read_size = chunk_size
+            position = end
+            yield item
+
+def iter_chunks(data: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    iterator = iter(data)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
 def phare_url_params(url: str, params: dict[str, Any] = {}):
     parsed_url = urlparse(url)
     query_params = parse_qs(parsed_url.query)
@@ -887,9 +1907,14 @@ def save_cookie(username: str, cookies: list[dict], dir_name: str='v2_shopee_ses
     
     print(f'cookie saved: {username}')
 
-def get_name_from_list_product(data: dict, filter_data: FilterDataModel):
-    titles = []
+def get_product_from_list_product(data: dict, filter_data: FilterDataModel, skip_item_ids: ScrapedItemIndex | set[int] | None = None) -> list[dict]:
+    products = []
+    skipped = 0
     for product in data['items']:
+        if skip_item_ids is not None and product['item_basic']['itemid'] in skip_item_ids:
+            skipped += 1
+            continue
+        
         name: str = product['item_basic']['name']
         price_min: int = product['item_basic']['price_min']
         price_min_idr = price_min // 100000
@@ -926,20 +1951,35 @@ def get_name_from_list_product(data: dict, filter_data: FilterDataModel):
         if is_continue:
             continue
         
-        titles.append(name)
+        products.append(product['item_basic'])
         
-    return titles 
+    if skipped:
+        print(f'skip {skipped} product sudah ada di database')
+        
+    return products
 
 def filter_product_duplikat(list_produk: list[dict]):
     titles_seen = set()
     return [d for d in list_produk if not (d['item']['title'] in titles_seen or titles_seen.add(d['item']['title']))]
 
-def remove_complete_url(url_complete: str):
-    with open('./list_url_or_keyword.txt', 'r') as f:
-        data_cat = [url.strip() for url in f.readlines() if url.strip() and url_complete.strip() != url.strip()]
+def load_accounts(path: str = './akun.txt') -> list[dict[str, Any]]:
+    with open(path, 'r') as f:
+        list_akun = list(set([i.strip() for i in f.readlines() if i.strip()]))
+        
+    data_akun: list[dict[str, Any]] = []
+    for akun in list_akun:
+        username, password, *_ = akun.split('|')
+        data_akun.append({'username': username, 'password': password, 'is_active': True, 'in_use': 0})
+        
+    return data_akun
+
+def remove_account(username: str, path: str = './akun.txt'):
+    with open(path, 'r') as f:
+        list_akun = list(set([i.strip() for i in f.readlines() if i.strip()]))
+        list_akun = [akun for akun in list_akun if not akun.startswith(username.strip())]
         
-    with open('./list_url_or_keyword.txt', 'w') as f:
-        f.write('\n'.join(data_cat))
+    with open(path, 'w') as f:
+        f.write('\n'.join(list_akun))
 
 def log_account_error_captcha(username: str, status: str):
     if not os.path.exists(path:= './log_account_error.txt'):
@@ -958,15 +1998,174 @@ def log_account_error_captcha(username: str, status: str):
     with open(path, 'w') as f:
         f.write('\n'.join(data))
 
+def get_logged_account_errors(path: str = './log_account_error.txt') -> dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    
+    with open(path, 'r') as f:
+        data = [i.strip() for i in f.readlines() if i.strip()]
+        
+    errors = {}
+    for line in data:
+        username, status, *_ = line.split(',')
+        errors[username] = status
+        
+    return errors
+
+def load_rate_limits(path: str = './data/rate_limit.json') -> dict[str, Any]:
+    if not os.path.exists(path):
+        return {'global': None, 'accounts': {}}
+    
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_rate_limits(rate_limits: dict[str, Any], path: str = './data/rate_limit.json'):
+    with open(path, 'w') as f:
+        json.dump(rate_limits, f, indent=4)
+
+def new_account_stats() -> dict[str, Any]:
+    return {
+        'jobs': 0,
+        'success': 0,
+        'failure': 0,
+        'captcha': 0,
+        'consecutive_captcha': 0,
+        'products': 0,
+        'recent_products': [],
+        'last_used': None,
+        'cooldown_until': 0,
+        'last_error': None
+    }
+
+def load_account_stats(path: str = './data/account_stats.json') -> dict[str, dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_account_stats(username: str, stats: dict[str, Any], path: str = './data/account_stats.json'):
+    account_stats = load_account_stats(path)
+    account_stats[username] = stats
+    with open(path, 'w') as f:
+        json.dump(account_stats, f, indent=4)
+
+def attach_account_stats(accounts: list[dict[str, Any]]):
+    account_stats = load_account_stats()
+    for account in accounts:
+        account['stats'] = {**new_account_stats(), **account_stats.get(account['username'], {})}
+
+def record_account_job(account: dict[str, Any], products: int, error: str | None, filter_data: FilterDataModel):
+    stats: dict[str, Any] = account['stats']
+    stats['jobs'] += 1
+    stats['products'] += products
+    stats['recent_products'] = [*stats['recent_products'], products][-10:]
+    stats['last_used'] = time.time()
+    stats['last_error'] = error
+    if error and 'error_url' not in error:
+        stats['failure'] += 1
+    else:
+        stats['success'] += 1
+        
+    if error and 'captcha' in error:
+        stats['captcha'] += 1
+        stats['consecutive_captcha'] += 1
+        cooldown = min(filter_data.account_cooldown * 2 ** (stats['consecutive_captcha'] - 1), filter_data.account_cooldown_max)
+        stats['cooldown_until'] = time.time() + cooldown
+        print(f'{account["username"]} cooldown {int(cooldown / 60)} menit')
+    elif not error:
+        stats['consecutive_captcha'] = 0
+        
+    save_account_stats(account['username'], stats)
+
+def get_account_cooldown(account: dict[str, Any]) -> float:
+    return max(account['stats']['cooldown_until'] - time.time(), 0)
+
+def get_account_score(account: dict[str, Any]) -> float:
+    recent_products: list[int] = account['stats']['recent_products']
+    if not recent_products:
+        return float('inf')
+    
+    return sum(recent_products) / len(recent_products)
+
+def rank_accounts(accounts: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    available = [account for account in accounts if account['is_active'] and get_account_cooldown(account) == 0]
+    return sorted(available, key=lambda account: (account['in_use'], -get_account_score(account), account['stats']['last_used'] or 0))
+
 
 # ================================ SCRAPE ================================
 
-async def filter_url_to_scrape(page: Page, url: str, page_int: int, filter_data: FilterDataModel):
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float, decrease: float, parent: 'AdaptiveRateLimiter | None' = None) -> None:
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.parent = parent
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+                
+            self.tokens -= 1
+            
+        if self.parent is not None:
+            await self.parent.acquire()
+            
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        if self.parent is not None:
+            self.parent.on_success()
+            
+    def on_error(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0.0)
+        if self.parent is not None:
+            self.parent.on_error()
+
+def create_rate_limiters(accounts: list[dict[str, Any]], filter_data: FilterDataModel) -> AdaptiveRateLimiter:
+    rate_limits = load_rate_limits()
+    logged_errors = get_logged_account_errors()
+    global_rate = rate_limits.get('global') or filter_data.rate_limit_initial * max(filter_data.max_account_concurrent, 1)
+    global_limiter = AdaptiveRateLimiter(global_rate, filter_data.rate_limit_min, filter_data.rate_limit_global_max, filter_data.rate_limit_increase, filter_data.rate_limit_decrease)
+    for account in accounts:
+        rate = rate_limits.get('accounts', {}).get(account['username'])
+        if rate is None:
+            rate = filter_data.rate_limit_initial
+            if 'captcha' in logged_errors.get(account['username'], ''):
+                rate *= filter_data.rate_limit_decrease
+                
+        account['rate_limiter'] = AdaptiveRateLimiter(rate, filter_data.rate_limit_min, filter_data.rate_limit_max, filter_data.rate_limit_increase, filter_data.rate_limit_decrease, parent=global_limiter)
+        
+    return global_limiter
+
+def save_account_rate_limits(accounts: list[dict[str, Any]], global_limiter: AdaptiveRateLimiter):
+    rate_limits = load_rate_limits()
+    rate_limits['global'] = global_limiter.rate
+    rate_limits.setdefault('accounts', {}).update({account['username']: account['rate_limiter'].rate for account in accounts if 'rate_limiter' in account})
+    save_rate_limits(rate_limits)
+
+async def filter_url_to_scrape(page: Page, url: str, page_int: int, filter_data: FilterDataModel, rate_limiter: AdaptiveRateLimiter | None = None):
     try:
         await page.wait_for_load_state('load', timeout=10000)
     except:
         pass
     
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+        
     if 'https://shopee.co.id/' in url:
         'https://shopee.co.id/Alat-&-Aksesoris-Musik-cat.11043572.11043648?facet=102019&maxPrice=150000&minPrice=20000&page=0&ratingFilter=4&sortBy=pop'
         if page_int == 0:
@@ -1001,32 +2200,66 @@ async def filter_url_to_scrape(page: Page, url: str, page_int: int, filter_data:
     
     return page.url
         
-async def loop_click_product(page: Page, browser: Browser, list_link_product: list[str], current_url: str):
-    empty_result = page.locator('div.shopee-search-empty-result-section')
-    empty_result_2 = page.locator('div.shopee-search-empty-result-section__hint')
+PRODUCT_HREF_JS = """() => Array.from(document.querySelectorAll('a[href*="-i."]'), (element) => element.href)"""
+
+async def get_product_hrefs(page: Page) -> dict[tuple[int, int], str]:
+    hrefs = {}
+    try:
+        for href in await page.evaluate(PRODUCT_HREF_JS):
+            match = re.search(r'-i\.(\d+)\.(\d+)', href)
+            if match:
+                hrefs[(int(match.group(1)), int(match.group(2)))] = href
+    except Exception as e:
+        print(f'error get product href: {e}')
+        
+    return hrefs
+
+async def open_product_tab(browser: Browser, context: BrowserContext, href: str, referer: str, save_product: Callable[[dict], Awaitable[Any]], rate_limiter: AdaptiveRateLimiter | None = None):
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+        
+    tab = await context.new_page()
+    try:
+        async with tab.expect_response(lambda response: 'api/v4/pdp/get_pc' in response.url, timeout=30000) as response_info:
+            await tab.goto(href, referer=referer)
+            
+        response = await response_info.value
+        await save_product(await response.json())
+        
+    finally:
+        captcha = await resolve_captcha(tab, browser, sleep=0.5)
+        await tab.close()
+        if captcha:
+            raise ValueError(captcha)
+
+async def open_product_tabs(page: Page, browser: Browser, context: BrowserContext, products: list[dict], save_product: Callable[[dict], Awaitable[Any]], max_tabs: int = 4, rate_limiter: AdaptiveRateLimiter | None = None):
+    hrefs = await get_product_hrefs(page)
+    semaphore = asyncio.Semaphore(max(max_tabs, 1))
     
+    async def open_product(product: dict):
+        async with semaphore:
+            href = hrefs.get((product['shopid'], product['itemid'])) or f'https://shopee.co.id/product/{product["shopid"]}/{product["itemid"]}'
+            await open_product_tab(browser, context, href, page.url, save_product, rate_limiter)
+            
+    unique_products = list({product['itemid']: product for product in products}.values())
+    results = await asyncio.gather(*[open_product(product) for product in unique_products], return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            if 'captcha' in str(result):
+                raise ValueError(str(result))
+            
+            print(f'error open product: {result}')
+
+async def loop_click_product(page: Page, browser: Browser, list_link_product: list[str], current_url: str, rate_limiter: AdaptiveRateLimiter | None = None):
     for name in list(set(list_link_product)):
         captcha = await resolve_captcha(page, browser, sleep=0.5)
         if captcha:
             raise ValueError(captcha)
 
-        try:
-            await empty_result.scroll_into_view_if_needed(timeout=500)
-            print('error url invalid')
-            raise ValueError('is_error_url')
-        
-        except Exception as e:
-            if str(e) == 'is_error_url':
-                raise ValueError('is_error_url')
-        
-        try:
-            await empty_result_2.scroll_into_view_if_needed(timeout=500)
+        if await detect_page_error(page, ['empty_result']):
             print('error url invalid')
             raise ValueError('is_error_url')
         
-        except Exception as e:
-            if str(e) == 'is_error_url':
-                raise ValueError('is_error_url')
         try:
             try:
                 await page.wait_for_load_state('domcontentloaded', timeout=10000)
@@ -1034,7 +2267,9 @@ async def loop_click_product(page: Page, browser: Browser, list_link_product: li
                 pass
             
             locator_product = page.locator('a', has_text=name[:25].strip())
-            
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+                
             try:
                 await locator_product.scroll_into_view_if_needed(timeout=2000)
                 await locator_product.click(timeout=2000)
@@ -1073,17 +2308,81 @@ async def loop_click_product(page: Page, browser: Browser, list_link_product: li
             
             print(f'error click product: {e}')
 
-async def resolve_captcha(page: Page, browser: Browser, sleep: int | float = 2):
-    # await asyncio.sleep(sleep)
-    laporkan = page.locator('button.cHPMhq', has_text='Laporkan Permasalahan')
-    masalah = page.locator('div.uUcrOy', has_text='kami mendeteksi masalah dari koneksi jaringanmu')
-    terjadi = page.locator('div.D4kY48', has_text='terjadi kesalahan saat memuat halaman')
-    cobalagi = page.locator('button.hKaCPY', has_text='Coba Lagi')
-    network_error = page.locator('div#captcha', has_text='network_error')
+async def wait_search_result(page: Page, search_result_event: asyncio.Event, timeout: float = 300) -> Literal['result', 'empty', 'verify', 'home', 'timeout']:
+    timeout = max(timeout, 0.001)
+    timeout_ms = timeout * 1000
+    deadline = time.time() + timeout
+    empty_result = page.locator('div.shopee-search-empty-result-section, div.shopee-search-empty-result-section__hint').first
+    waiters = {
+        asyncio.create_task(search_result_event.wait()): 'result',
+        asyncio.create_task(empty_result.wait_for(state='visible', timeout=timeout_ms)): 'empty',
+        asyncio.create_task(page.wait_for_url(lambda url: '/verify/' in url, timeout=timeout_ms)): 'verify',
+        asyncio.create_task(page.wait_for_url(lambda url: url.rstrip('/') == 'https://shopee.co.id', timeout=timeout_ms)): 'home',
+    }
+    pending = set(waiters)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - time.time(), 0), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return waiters[task]
+                
+        return 'timeout'
     
-    start = time.time()
+    finally:
+        for task in waiters:
+            task.cancel()
+            
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+PAGE_ERROR_CHECKS = [
+    ('network_error', 'div#captcha', 'network_error'),
+    ('laporkan', 'button.cHPMhq', 'Laporkan Permasalahan'),
+    ('terjadi', 'div.D4kY48', 'terjadi kesalahan saat memuat halaman'),
+    ('masalah', 'div.uUcrOy', 'kami mendeteksi masalah dari koneksi jaringanmu'),
+    ('cobalagi', 'button.hKaCPY', 'Coba Lagi'),
+    ('empty_result', 'div.shopee-search-empty-result-section, div.shopee-search-empty-result-section__hint', ''),
+]
+
+PAGE_ERROR_MESSAGES = {
+    'laporkan': 'error traffic captcha: Laporkan Permasalahan',
+    'terjadi': 'error traffic captcha: Laporkan Permasalahan',
+    'masalah': 'Maaf, kami mendeteksi masalah dari koneksi jaringanmu.',
+    'cobalagi': 'Maaf, kami mendeteksi masalah dari koneksi jaringanmu.',
+}
+
+DETECT_PAGE_ERROR_JS = """(checks) => {
+    const normalize = (value) => value.replace(/\\s+/g, ' ').trim().toLowerCase();
+    for (const [name, selector, text] of checks) {
+        for (const element of document.querySelectorAll(selector)) {
+            // hidden and template nodes have no layout box, the old locator checks ignored them too
+            if (element.getClientRects().length === 0) {
+                continue;
+            }
+            if (normalize(element.textContent).includes(normalize(text))) {
+                return name;
+            }
+        }
+    }
+    return null;
+}"""
+
+async def detect_page_error(page: Page, names: list[str] | None = None) -> str | None:
+    checks = [check for check in PAGE_ERROR_CHECKS if names is None or check[0] in names]
+    try:
+        return await page.evaluate(DETECT_PAGE_ERROR_JS, checks)
+    except Exception:
+        # the page is navigating and the old execution context is gone
+        return None
+
+async def resolve_captcha(page: Page, browser: Browser, sleep: int | float = 2, timeout: int | float = 300):
+    # await asyncio.sleep(sleep)
+    deadline = time.time() + timeout
     while True:
-        if (time.time() - start) > 300:
+        if time.time() > deadline:
             print('tidak ada pergerakan selama 5 menit')
             return 'resolve_captcha traffic error captcha'
             # raise ValueError('resolve_captcha tidak ada pergerakan')
@@ -1101,48 +2400,21 @@ async def resolve_captcha(page: Page, browser: Browser, sleep: int | float = 2):
             return 'resolve_captcha traffic error captcha'
             # raise ValueError('resolve_captcha traffic error captcha')
         
-        try:
-            await network_error.scroll_into_view_if_needed(timeout=300)
+        page_error = await detect_page_error(page, ['network_error', *PAGE_ERROR_MESSAGES])
+        if page_error == 'network_error':
             await page.goto('https://shopee.co.id/', referer=page.url)
             await asyncio.sleep(2)
-        except:
-            pass
-        
-        try:
-            await laporkan.scroll_into_view_if_needed(timeout=300)
-            print('error traffic captcha: Laporkan Permasalahan')
-            return 'resolve_captcha traffic error captcha'
-            # raise ValueError('resolve_captcha traffic error captcha')
-        except:
-            pass
-        
-        try:
-            await terjadi.scroll_into_view_if_needed(timeout=300)
-            print('error traffic captcha: Laporkan Permasalahan')
-            return 'resolve_captcha traffic error captcha'
-            # raise ValueError('resolve_captcha traffic error captcha')
-        except:
-            pass
-        
-        try:
-            await masalah.scroll_into_view_if_needed(timeout=300)
-            print('Maaf, kami mendeteksi masalah dari koneksi jaringanmu.')
-            return 'resolve_captcha traffic error captcha'
-            # raise ValueError('resolve_captcha traffic error captcha')
-        except:
-            pass
-        
-        try:
-            await cobalagi.scroll_into_view_if_needed(timeout=300)
-            print('Maaf, kami mendeteksi masalah dari koneksi jaringanmu.')
+            
+        elif page_error:
+            print(PAGE_ERROR_MESSAGES[page_error])
             return 'resolve_captcha traffic error captcha'
-            # raise ValueError('resolve_captcha traffic error captcha')
-        except:
-            pass
         
         if '/verify/captcha' in page.url:
             print('menunggu resolve captcha...')
-            await asyncio.sleep(2)
+            try:
+                await page.wait_for_url(lambda url: '/verify/captcha' not in url, timeout=max(deadline - time.time(), 0.001) * 1000)
+            except:
+                pass
         else:
             break
         
@@ -1228,7 +2500,114 @@ async def starter_page(page: Page):
     except:
         await page.goto('https://shopee.co.id/', referer=page.url)
     
-async def scrape(cursor: Cursor, url: str, filter_data: FilterDataModel, username: str, password: str):
+async def apply_resource_policy(context: BrowserContext, filter_data: FilterDataModel):
+    if not filter_data.block_resource_types and not filter_data.block_url_patterns:
+        return
+    
+    block_resource_types = set(filter_data.block_resource_types)
+    
+    async def handle_route(route: Route):
+        request = route.request
+        if 'api/v4/' not in request.url:
+            try:
+                is_verify = '/verify/' in request.frame.url
+            except Exception:
+                is_verify = False
+                
+            if not is_verify and (request.resource_type in block_resource_types or any(pattern in request.url for pattern in filter_data.block_url_patterns)):
+                await route.abort()
+                return
+            
+        await route.fallback()
+        
+    await context.route('**/*', handle_route)
+
+class AccountSession:
+    def __init__(self, browser: Browser, username: str, password: str, filter_data: FilterDataModel | None = None, rate_limiter: AdaptiveRateLimiter | None = None) -> None:
+        self.browser = browser
+        self.username = username
+        self.password = password
+        self.filter_data = filter_data
+        self.rate_limiter = rate_limiter
+        self.context: BrowserContext | None = None
+        self.page: Page | None = None
+        
+    @property
+    def is_ready(self) -> bool:
+        return self.context is not None and self.page is not None and not self.page.is_closed() and self.browser.is_connected()
+        
+    async def start(self):
+        await self.close()
+        self.context = await self.browser.new_context()
+        if self.filter_data is not None:
+            await apply_resource_policy(self.context, self.filter_data)
+            
+        is_cookie: list[dict] | None = get_cookies(self.username)
+        if is_cookie:
+            print(f'add_cookies: {self.username}')
+            await self.context.add_cookies(is_cookie)
+        
+        else:
+            raise FileNotFoundError(f'cookie not found {self.username}')
+            
+        self.page = await self.context.new_page()
+        await starter_page(self.page)
+            
+        starting = await loop_starting(self.page, self.browser, self.context, self.username, self.password) 
+        if starting:
+            raise ValueError(starting)
+        
+    async def save_cookies(self):
+        if self.context is not None:
+            cookies = await self.context.cookies()
+            save_cookie(self.username, cookies)
+        
+    async def close(self):
+        if self.context is None:
+            return
+        
+        try:
+            if self.browser.is_connected():
+                await self.save_cookies()
+                await self.context.close()
+        except Exception as e:
+            print(f'error close session {self.username}: {e}')
+            
+        self.context = None
+        self.page = None
+
+def new_search_state() -> dict[str, Any]:
+    return {
+        'list_link_product': [],
+        'list_product_to_scrape': [],
+        'is_nol_to_scrape': False,
+        'is_running_scrape': False,
+        'search_result_event': asyncio.Event()
+    }
+
+def reset_search_state(state: dict[str, Any]):
+    state['list_link_product'] = []
+    state['list_product_to_scrape'] = []
+    state['is_nol_to_scrape'] = False
+    state['is_running_scrape'] = False
+    state['search_result_event'].clear()
+
+def get_page_url(url: str, current_url: str, page_int: int, filter_data: FilterDataModel) -> str:
+    if 'https://shopee.co.id/' in url:
+        return phare_url_params(url, params={'page': page_int, 'minPrice': filter_data.price_min, 'maxPrice': filter_data.price_max, 'ratingFilter': int(filter_data.min_rating), 'sortBy': 'pop'})
+    
+    return phare_url_params(current_url, params={'page': page_int})
+
+async def prefetch_search_page(page: Page, url: str, referer: str, state: dict[str, Any], timeout: float = 120, rate_limiter: AdaptiveRateLimiter | None = None) -> str:
+    reset_search_state(state)
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+        
+    await page.goto(url, referer=referer)
+    return await wait_search_result(page, state['search_result_event'], timeout=timeout)
+
+async def scrape(session: AccountSession, collection: Collection, url: str, filter_data: FilterDataModel, item_index: ScrapedItemIndex | None = None, on_progress: Callable[[str], Any] | None = None, on_checkpoint: Callable[[list[int]], Any] | None = None):
+    username = session.username
     last_data = {
         'data_product': [],
         'last_url': url,
@@ -1236,152 +2615,388 @@ async def scrape(cursor: Cursor, url: str, filter_data: FilterDataModel, usernam
         'error': None
     }
     
-    list_link_product = []
-    is_nol_to_scrape = False
-    is_running_scrape = False
+    def on_product_inserted(inserted: list[dict], status: dict[str, int]):
+        for product in inserted:
+            if item_index is not None:
+                item_index.add(product['id'])
+                
+            last_data['data_product'].append(product)
+            title: str = product['name']
+            print(f'scraped: {title[:70]}')
+            
+        if on_checkpoint is not None and inserted:
+            on_checkpoint([product['id'] for product in inserted])
+            
+        if status['duplicate']:
+            print(f'duplikat: {status["duplicate"]} product')
+    
+    db_config = get_db_config()
+    writer = MongoBatchWriter(collection, db_config.writer_batch_size, db_config.writer_flush_interval, db_config.writer_max_queue, on_inserted=on_product_inserted)
+    writer.start()
     
     try:
-        async def capture_request(request: Request):
-            nonlocal is_nol_to_scrape, list_link_product, is_running_scrape, last_data
-            try:
-                if 'api/v4/pdp/get_pc' in request.url:
-                    response = await request.response()
-                    res_json: dict = await response.json()
-                    data = res_json.get('data', None)
-                    if data:
-                        converted_data = convert_product_shopee_to_pdc(res_json, namespace=filter_data.name_space)
-                        status_product_db = insert_one_item_to_db(cursor, converted_data)
-                        if status_product_db:
-                            last_data['data_product'].append(data)
-                            title: str = data['item']['title']
-                            print(f'scraped: {title[:70]}')
-                    else:
-                        print(f'error scrape | response: {res_json}')
-                        
-                    
-                if 'api/v4/search/search_items' in request.url:
-                    response = await request.response()
-                    res_json = await response.json()
-                    if 'scenario' in request.url:
-                        if not is_running_scrape:
-                            name_to_scrape = get_name_from_list_product(res_json, filter_data)
-                            if len(name_to_scrape) == 0:
-                                is_nol_to_scrape = True
-                            
-                            list_link_product.extend(name_to_scrape)
-                            
-                    else:
-                        print(f'error request url: {request.url}')
-            except Exception as e:
-                print(f'error http request: {str(e)}')
-        
-        async with async_playwright() as p:
-            browser: Browser = await p.firefox.launch(headless=False)
-            context: BrowserContext = await browser.new_context()
+        if item_index is not None:
+            item_index.set_name_space(filter_data.name_space)
             
-            is_cookie: list[dict] | None = get_cookies(username)
-            if is_cookie:
-                print(f'add_cookies: {username}')
-                await context.add_cookies(is_cookie)
+        if item_index is not None and item_index.is_stale(db_config.item_index_refresh_interval):
+            await asyncio.to_thread(item_index.refresh)
             
+        async def save_product(res_json: dict):
+            await archive_raw_response('get_pc', filter_data.name_space, res_json)
+            data = res_json.get('data', None)
+            if data:
+                if session.rate_limiter is not None:
+                    session.rate_limiter.on_success()
+                    
+                converted_data = convert_product_shopee_to_pdc(res_json, namespace=filter_data.name_space)
+                await writer.put(converted_data)
             else:
-                raise FileNotFoundError(f'cookie not found {username}')
+                print(f'error scrape | response: {res_json}')
                 
-            page = await context.new_page()
+        def make_capture_request(state: dict[str, Any]):
+            async def capture_request(request: Request):
+                try:
+                    if 'api/v4/pdp/get_pc' in request.url:
+                        response = await request.response()
+                        res_json: dict = await response.json()
+                        await save_product(res_json)
+                        
+                    if 'api/v4/search/search_items' in request.url:
+                        response = await request.response()
+                        res_json = await response.json()
+                        if 'scenario' in request.url:
+                            if not state['is_running_scrape']:
+                                await archive_raw_response('search_items', filter_data.name_space, res_json)
+                                product_to_scrape = get_product_from_list_product(res_json, filter_data, item_index)
+                                if len(product_to_scrape) == 0:
+                                    state['is_nol_to_scrape'] = True
+                                
+                                state['list_link_product'].extend(product['name'] for product in product_to_scrape)
+                                state['list_product_to_scrape'].extend(product_to_scrape)
+                                state['search_result_event'].set()
+                                
+                        else:
+                            print(f'error request url: {request.url}')
+                except Exception as e:
+                    print(f'error http request: {str(e)}')
+                    
+            return capture_request
+        
+        if not session.is_ready:
+            await session.start()
             
-            try:
-                page.on('request', capture_request)
-            except Exception as e:
-                print(e)
-    
-            await starter_page(page)
-                
-            starting = await loop_starting(page, browser, context, username, password) 
-            if starting:
-                raise ValueError(starting)
+        browser = session.browser
+        page = session.page
+        state = new_search_state()
+        listeners = [(page, make_capture_request(state))]
+        next_page: Page | None = None
+        next_state = new_search_state()
+        prefetch_task: asyncio.Task | None = None
+        if filter_data.prefetch_next_page:
+            next_page = await session.context.new_page()
+            listeners.append((next_page, make_capture_request(next_state)))
             
-            empty_result = page.locator('div.shopee-search-empty-result-section')
-            empty_result_2 = page.locator('div.shopee-search-empty-result-section__hint')
+        for listener_page, capture_request in listeners:
+            listener_page.on('request', capture_request)
             
+        try:
             resume_page = get_value_params(url, 'page')
             
             for page_int in range(int(resume_page) if resume_page is not None else 0, filter_data.max_page_scrape):
-                list_link_product = []
-                
                 try:
-                    captcha = await resolve_captcha(page, browser, sleep=0.5)
-                    if captcha:
-                        raise ValueError(captcha)
-                    
-                    print('get url to scrape')
-                    is_running_scrape = False
-                    current_url = await filter_url_to_scrape(page, url, page_int, filter_data)
-                    last_data['last_url'] = current_url
-                    captcha = await resolve_captcha(page, browser, sleep=0.5)
-                    if captcha:
-                        raise ValueError(captcha)
-                    
-                    print(f'get product to scrape: page {page_int}')
-                    start_while = time.time()
-                    while (time.time() - start_while) < 300:
-                        if len(list_link_product) > 0:
-                            print(f'product to scrape: {len(list_link_product)} product')
-                            is_running_scrape = True
-                            break
-                        
-                        if page.url == 'https://shopee.co.id/' or page.url == 'https://shopee.co.id':
-                            current_url = await filter_url_to_scrape(page, url, page_int, filter_data)
-                        
-                        if is_nol_to_scrape:
-                            raise ValueError('error: tidak ada produk untuk di scrape!')
-                        
-                        try:
-                            await empty_result.scroll_into_view_if_needed(timeout=700)
-                            print('error url invalid')
-                            raise ValueError('is_error_url')
-                        
-                        except Exception as e:
-                            if str(e) == 'is_error_url':
-                                raise ValueError('is_error_url')
-                        
+                    status = None
+                    if prefetch_task is not None:
                         try:
-                            await empty_result_2.scroll_into_view_if_needed(timeout=700)
-                            print('error url invalid')
-                            raise ValueError('is_error_url')
-                        
+                            status = await prefetch_task
                         except Exception as e:
-                            if str(e) == 'is_error_url':
-                                raise ValueError('is_error_url')
-                        
-                        if 'verify/traffic/error' in page.url:
-                            raise ValueError('error: verify/traffic/error')
+                            print(f'error prefetch page {page_int}: {e}')
+                            
+                        prefetch_task = None
+                        if status in ('result', 'empty'):
+                            page, next_page = next_page, page
+                            state, next_state = next_state, state
+                            current_url = page.url
+                            last_data['last_url'] = current_url
+                            print(f'get product to scrape: page {page_int} (prefetch)')
+                        else:
+                            status = None
+                            
+                    if status is None:
+                        reset_search_state(state)
+                        captcha = await resolve_captcha(page, browser, sleep=0.5)
+                        if captcha:
+                            raise ValueError(captcha)
                         
+                        print('get url to scrape')
+                        current_url = await filter_url_to_scrape(page, url, page_int, filter_data, session.rate_limiter)
+                        last_data['last_url'] = current_url
                         captcha = await resolve_captcha(page, browser, sleep=0.5)
                         if captcha:
                             raise ValueError(captcha)
                         
-                    await loop_click_product(page, browser, list_link_product, current_url)
+                        print(f'get product to scrape: page {page_int}')
+                        deadline = time.time() + 300
+                        while True:
+                            status = await wait_search_result(page, state['search_result_event'], timeout=deadline - time.time())
+                            if status in ('result', 'empty'):
+                                break
+                            
+                            if status == 'home':
+                                current_url = await filter_url_to_scrape(page, url, page_int, filter_data, session.rate_limiter)
+                                
+                            captcha = await resolve_captcha(page, browser, sleep=0.5)
+                            if captcha:
+                                raise ValueError(captcha)
+                            
+                            if status == 'verify' and '/verify/' in page.url:
+                                # a verify page resolve_captcha does not handle, wait for it to go away instead of spinning
+                                try:
+                                    await page.wait_for_url(lambda url: '/verify/' not in url, timeout=max(deadline - time.time(), 0.001) * 1000)
+                                except Exception:
+                                    raise ValueError('resolve_captcha traffic error captcha')
+                                
+                            if status == 'timeout':
+                                break
+                            
+                    if status == 'empty':
+                        print('error url invalid')
+                        raise ValueError('is_error_url')
+                    
+                    if on_progress is not None:
+                        on_progress(current_url)
+                        
+                    state['is_running_scrape'] = True
+                    if status == 'result' and session.rate_limiter is not None:
+                        session.rate_limiter.on_success()
+                        
+                    if next_page is not None and page_int + 1 < filter_data.max_page_scrape:
+                        prefetch_task = asyncio.create_task(prefetch_search_page(next_page, get_page_url(url, current_url, page_int + 1, filter_data), current_url, next_state, rate_limiter=session.rate_limiter))
+                        
+                    if state['is_nol_to_scrape']:
+                        print('tidak ada produk untuk di scrape!')
+                        continue
+                        
+                    print(f'product to scrape: {len(state["list_link_product"])} product')
+                    if filter_data.scrape_mode == 'search_list':
+                        for product in state['list_product_to_scrape']:
+                            await writer.put(convert_item_basic_to_pdc(product, namespace=filter_data.name_space))
+                        
+                    elif filter_data.scrape_mode == 'tab':
+                        await open_product_tabs(page, browser, session.context, state['list_product_to_scrape'], save_product, filter_data.max_product_tabs, session.rate_limiter)
+                    else:
+                        await loop_click_product(page, browser, state['list_link_product'], current_url, session.rate_limiter)
                     
                 except Exception as e:
                     last_data['error'] = str(e)
                     if 'captcha' in str(e):
                         raise ValueError(str(e))
+                    
+                    if 'error_url' in str(e):
+                        break
                 
-            cookies = await context.cookies()
-            save_cookie(username, cookies)
-            await browser.close()
+            await session.save_cookies()
+            
+        finally:
+            if prefetch_task is not None:
+                prefetch_task.cancel()
+                await asyncio.gather(prefetch_task, return_exceptions=True)
+                
+            for listener_page, capture_request in listeners:
+                listener_page.remove_listener('request', capture_request)
+                
+            session.page = page
+            if next_page is not None and not next_page.is_closed():
+                await next_page.close()
     
     except Exception as e:
         # traceback.print_exc()
         last_data['error'] = str(e)
         
     finally:
+        await writer.close()
         return last_data
     
+
+async def keep_scrape_job_lease(job_collection: Collection, job: dict[str, Any], worker_id: str, lease_seconds: int, scrape_task: asyncio.Task):
+    lease_until = job['lease_until']
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        renewed_at = time.time()
+        try:
+            is_renewed = await asyncio.to_thread(heartbeat_scrape_job, job_collection, job, worker_id, lease_seconds)
+        except Exception as e:
+            # a failed renewal is not a lost lease, retry while the current lease still holds
+            if time.time() < lease_until:
+                print(f'error heartbeat job {job["url"]}: {e}')
+                continue
+            
+            is_renewed = False
+            
+        if not is_renewed:
+            # another worker may claim the job now, stop scraping it here
+            print(f'lease hilang, scrape dihentikan: {job["url"]}')
+            scrape_task.cancel()
+            return
+        
+        lease_until = renewed_at + lease_seconds
+
+async def release_scrape_job(job_collection: Collection, job: dict[str, Any], worker_id: str, status: Literal['pending', 'done', 'failed'], error: str | None = None) -> bool:
+    is_released = await asyncio.to_thread(finish_scrape_job, job_collection, job, worker_id, status, error)
+    if not is_released:
+        print(f'job {job["url"]} tidak lagi dipegang worker ini, status "{status}" tidak disimpan')
+        
+    return is_released
+
+async def scrape_job(session: AccountSession, collection: Collection, job_collection: Collection, job: dict[str, Any], worker_id: str, account: dict[str, Any], filter_data: FilterDataModel, item_index: ScrapedItemIndex) -> str | None:
+    username: str = account['username']
+    print(f'{job["last_url"]} | {username}')
+    checkpoint_item_ids: list[int] = job.setdefault('checkpoint_item_ids', [])
+    if checkpoint_item_ids:
+        print(f'checkpoint: skip {len(checkpoint_item_ids)} product sudah di scrape')
+        for item_id in checkpoint_item_ids:
+            item_index.add(item_id)
+            
+    scrape_task = asyncio.create_task(scrape(session, collection, job['last_url'], filter_data, item_index, on_progress=lambda current_url: job.update(last_url=current_url), on_checkpoint=checkpoint_item_ids.extend))
+    heartbeat = asyncio.create_task(keep_scrape_job_lease(job_collection, job, worker_id, filter_data.job_lease_seconds, scrape_task))
+    try:
+        result = await scrape_task
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        
+    job['last_url'] = result['last_url']
+    error = result['error']
+    record_account_job(account, len(result['data_product']), error, filter_data)
+    
+    print(f'{username} | {error = }')
+    
+    if heartbeat.done() and not heartbeat.cancelled():
+        if heartbeat.exception() is not None:
+            # the heartbeat crashed but the lease was never reported lost, release the job as usual
+            print(f'error heartbeat job {job["url"]}: {heartbeat.exception()}')
+        else:
+            # the heartbeat only returns by itself when the lease was lost
+            return 'lease hilang'
+        
+    
+    if error and 'error_url' in error:
+        print('break', error)
+        await release_scrape_job(job_collection, job, worker_id, 'done', error)
+        return error
+    
+    if error:
+        log_account_error_captcha(username, error)
+        if 'captcha' in error and session.rate_limiter is not None:
+            session.rate_limiter.on_error()
+            
+        if 'captcha' in error:
+            print('continue', error)
+            await release_scrape_job(job_collection, job, worker_id, 'pending', error)
+            return error
+        
+        if 'login gagal' in error or 'cookie not found' in error:
+            account['is_active'] = False
+            if 'login gagal' in error:
+                remove_account(username)
+                
+            print('continue', error)
+            await release_scrape_job(job_collection, job, worker_id, 'pending', error)
+            return error
+        
+        job['retry'] += 1
+        if job['retry'] <= filter_data.max_retry_url:
+            await release_scrape_job(job_collection, job, worker_id, 'pending', error)
+            return error
+        
+        print(f'gagal scrape: {job["url"]}')
+        await release_scrape_job(job_collection, job, worker_id, 'failed', error)
+        return error
+    
+    await release_scrape_job(job_collection, job, worker_id, 'done')
+    return None
+
+def pick_account(accounts: list[dict[str, Any]], max_url_per_account: int) -> dict[str, Any] | None:
+    available = [account for account in rank_accounts(accounts) if account['in_use'] < max_url_per_account]
+    if not available:
+        return None
+    
+    return available[0]
+
+def get_next_cooldown(accounts: list[dict[str, Any]]) -> float | None:
+    cooldowns = [get_account_cooldown(account) for account in accounts if account['is_active'] and get_account_cooldown(account) > 0]
+    return min(cooldowns) if cooldowns else None
+
+async def scrape_slot(browser: Browser, collection: Collection, job_collection: Collection, worker_id: str, accounts: list[dict[str, Any]], filter_data: FilterDataModel, item_index: ScrapedItemIndex):
+    while True:
+        account = pick_account(accounts, filter_data.max_url_per_account)
+        if account is None:
+            cooldown = get_next_cooldown(accounts)
+            if cooldown is None:
+                return
+            
+            print(f'semua akun cooldown, tunggu {int(cooldown / 60)} menit')
+            await asyncio.sleep(cooldown)
+            continue
+        
+        account['in_use'] += 1
+        session = AccountSession(browser, account['username'], account['password'], filter_data, account.get('rate_limiter'))
+        try:
+            while account['is_active'] and get_account_cooldown(account) == 0:
+                job = await asyncio.to_thread(claim_scrape_job, job_collection, worker_id, filter_data.job_lease_seconds)
+                if job is None:
+                    lease_expiry = await asyncio.to_thread(get_next_lease_expiry, job_collection)
+                    if lease_expiry is None:
+                        return
+                    
+                    await asyncio.sleep(min(max(lease_expiry, 1), 60))
+                    continue
+                
+                try:
+                    error = await scrape_job(session, collection, job_collection, job, worker_id, account, filter_data, item_index)
+                    if not filter_data.persistent_session or (error and 'error_url' not in error):
+                        await session.close()
+                        
+                except Exception:
+                    traceback.print_exc()
+                    await release_scrape_job(job_collection, job, worker_id, 'pending', 'slot error')
+                    await session.close()
+                    
+        finally:
+            account['in_use'] -= 1
+            await session.close()
+
+async def run_scrape_pool(collection: Collection, job_collection: Collection, accounts: list[dict[str, Any]], filter_data: FilterDataModel, item_index: ScrapedItemIndex):
+    worker_id = f'{socket.gethostname()}-{os.getpid()}'
+    global_limiter = create_rate_limiters(accounts, filter_data)
+    attach_account_stats(accounts)
+    async with async_playwright() as p:
+        browser: Browser = await p.firefox.launch(headless=filter_data.headless)
+        slot_count = min(filter_data.max_account_concurrent, len(accounts)) * filter_data.max_url_per_account
+        slots = [asyncio.create_task(scrape_slot(browser, collection, job_collection, worker_id, accounts, filter_data, item_index)) for _ in range(slot_count)]
+        try:
+            results = await asyncio.gather(*slots, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print('error scrape slot:')
+                    traceback.print_exception(type(result), result, result.__traceback__)
+                    
+        finally:
+            for task in slots:
+                task.cancel()
+                
+            await asyncio.gather(*slots, return_exceptions=True)
+            await browser.close()
+            save_account_rate_limits(accounts, global_limiter)
+            await close_raw_archive()
+            
+    if job_collection.count_documents({'status': 'pending'}) > 0:
+        raise ValueError('akun telah habis!')
+
 def main_scrape():
     try:
         try:
-            cursor = get_cursor()
+            collection = get_collection()
+            get_client().admin.command('ping')
         except:
             raise Exception('error: Mongodb disconnect!!!')
         
@@ -1396,69 +3011,128 @@ def main_scrape():
             
         filter_data = FilterDataModel(**config)
         
-        with open(path_config:='./data/config.json', 'w') as f:
+        with open('./data/config.json', 'w') as f:
             json.dump(filter_data.model_dump(), f, indent=4)
             
         with open(path_list_url_or_keyword:='./list_url_or_keyword.txt', 'r') as f:
-            list_url = [i.strip() for i in f.readlines() if i]
+            list_url = [i.strip() for i in f.readlines() if i.strip()]
             
-        with open(path_akun:='./akun.txt', 'r') as f:
-            list_akun = list(set([i.strip() for i in f.readlines() if i]))
+        job_collection = get_job_collection(collection)
+        ensure_job_indexes(job_collection)
+        added, failed_urls = sync_scrape_jobs(job_collection, list_url)
+        # only the lines that could not be queued stay in the file
+        with open(path_list_url_or_keyword, 'w') as f:
+            f.write(''.join(f'{url}\n' for url in failed_urls))
             
-        data_akun: list[dict[str, str]] = []
-        for akun in list_akun:
-            username, password, *_ = akun.split('|')
-            data_akun.append({'username': username, 'password': password})
+        print(f'job baru: {added} | job pending: {job_collection.count_documents({"status": "pending"})}')
+        
+        data_akun = load_accounts()
+        if len(data_akun) < 1:
+            raise ValueError('akun telah habis!')
             
         print(filter_data)
         
-        for index_url, url in enumerate(list_url, start=1):
-            last_url = url
-            while True:
-                print(f'{index_url}. {last_url}')
-                if len(data_akun) >= 1:
-                    random_pick_akun: dict[str, str] = random.choice(data_akun)
-                else:
-                    raise ValueError('akun telah habis!')
-                    
-                result = asyncio.run(scrape(cursor, last_url, filter_data, random_pick_akun['username'], random_pick_akun['password']))
-                last_url = result['last_url']
-                error = result['error']
-                len_data_product = len(result['data_product'])
-                last_page = get_value_params(last_url, 'page')
+        print(f'load item id namespace "{filter_data.name_space}" dari database...')
+        item_index = ScrapedItemIndex(collection, filter_data.name_space)
+        item_index.refresh()
+        print(f'{len(item_index)} item id')
+        
+        asyncio.run(run_scrape_pool(collection, job_collection, data_akun, filter_data, item_index))
+        
+        print('selesai...')
+        
+    except:
+        traceback.print_exc()
+        
+
+async def backfill_partial_items(session: AccountSession, collection: Collection, pending: dict[Any, dict], max_tabs: int = 4):
+    # done items are popped from the shared pending dict, so progress survives a captcha raise
+    semaphore = asyncio.Semaphore(max(max_tabs, 1))
+    
+    async def backfill_item(item: dict):
+        async def save_product(res_json: dict):
+            await archive_raw_response('get_pc', item['namespace'], res_json)
+            if not res_json.get('data', None):
+                print(f'error backfill | response: {res_json}')
+                return
+            
+            converted_data = convert_product_shopee_to_pdc(res_json, namespace=item['namespace'])
+            await asyncio.to_thread(collection.replace_one, {'_id': item['_id']}, store_pdc(converted_data))
+            # the partial item was already counted on insert, only refresh price and shop
+            await asyncio.to_thread(update_namespace_summary, collection, [converted_data], False)
+            pending.pop(item['_id'], None)
+            print(f'backfill: {converted_data["name"][:70]}')
+            
+        async with semaphore:
+            await open_product_tab(session.browser, session.context, item['url'], session.page.url, save_product, session.rate_limiter)
+            
+    for chunk in iter_chunks(list(pending.values()), max(max_tabs, 1) * 5):
+        results = await asyncio.gather(*[backfill_item(item) for item in chunk], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                if 'captcha' in str(result):
+                    raise ValueError(str(result))
                 
-                print(f'{error = }')
+                print(f'error backfill: {result}')
                 
-                if error and 'error_url' in error:
-                    print('break', error)
+
+async def run_backfill(collection: Collection, items: list[dict], accounts: list[dict[str, Any]], filter_data: FilterDataModel) -> int:
+    pending = {item['_id']: item for item in items}
+    global_limiter = create_rate_limiters(accounts, filter_data)
+    attach_account_stats(accounts)
+    async with async_playwright() as p:
+        browser: Browser = await p.firefox.launch(headless=filter_data.headless)
+        try:
+            for account in rank_accounts(accounts):
+                if not pending:
                     break
                 
-                if error:
-                    log_account_error_captcha(random_pick_akun['username'], error)
-                    if 'captcha' in error or 'login gagal' in error:
-                        data_akun = [dt_akun for dt_akun in data_akun if dt_akun['username'].strip() != random_pick_akun['username'].strip()]
-                        with open(path_akun, 'r') as f:
-                            list_akun = list(set([i.strip() for i in f.readlines() if i.strip()]))
-                            list_akun = [akun for akun in list_akun if not akun.startswith(random_pick_akun['username'].strip())]
-                            
-                        with open(path_akun, 'w') as f:
-                            f.write('\n'.join(list_akun))
-                    
-                if error and 'captcha' in error:
-                    print('continue', error)
-                    continue
-                
-                if error and 'login gagal' in error:
-                    print('continue', error)
-                    continue
+                session = AccountSession(browser, account['username'], account['password'], filter_data, account['rate_limiter'])
+                pending_before = len(pending)
+                error = None
+                try:
+                    await session.start()
+                    await backfill_partial_items(session, collection, pending, filter_data.max_product_tabs)
+                except Exception as e:
+                    error = str(e)
+                    print(f'{account["username"]} | error = {e}')
+                    log_account_error_captcha(account['username'], str(e))
+                    if 'captcha' in str(e):
+                        account['rate_limiter'].on_error()
+                        
+                finally:
+                    record_account_job(account, pending_before - len(pending), error, filter_data)
+                    await session.close()
                     
-                if last_page and int(last_page) - 1 >= filter_data.max_page_scrape:
-                    print('break last_page', last_page)
-                    break
-                
-            remove_complete_url(url)
+        finally:
+            await browser.close()
+            save_account_rate_limits(accounts, global_limiter)
+            await close_raw_archive()
+            
+    return len(pending)
+
+def main_backfill():
+    try:
+        collection = get_collection()
+        with open('./data/config.json', 'r') as f:
+            filter_data = FilterDataModel(**json.load(f))
+            
+        name_space = str(input('masukkan namespace (default: semua produk shopee): ')).strip()
+        query: dict[str, Any] = {'marketplace': 'shopee', 'partial': True}
+        if name_space:
+            query['namespace'] = name_space
+            
+        items = list(collection.find(query, {'_id': 1, 'id': 1, 'namespace': 1, 'url': 1}))
+        print(f'product belum lengkap: {len(items)}')
+        if not items:
+            return
         
-        print('selesai...')
+        data_akun = load_accounts()
+        if len(data_akun) < 1:
+            raise ValueError('akun telah habis!')
+        
+        pending = asyncio.run(run_backfill(collection, items, data_akun, filter_data))
+        print(f'backfill selesai: {len(items) - pending} product, gagal: {pending} product')
         
     except:
         traceback.print_exc()
@@ -1485,6 +3159,12 @@ def main(arg: list[str]):
             elif arg[1] == 'convert_from_json_file':
                 convert_to_pdc_from_json()
                 
+            elif arg[1] == 'backfill':
+                main_backfill()
+                
+            elif arg[1] == 'reprocess':
+                main_reprocess()
+                
             elif arg[1] == 'collection_manager':
                 collection_manager = CollectionManager()
                 collection_manager.main_usage()
@@ -1497,6 +3177,7 @@ def main(arg: list[str]):
     except:
         traceback.print_exc()
     finally:
+        close_client()
         time.sleep(10)
         
 if __name__ == '__main__':